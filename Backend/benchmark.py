@@ -0,0 +1,256 @@
+"""Offline benchmark for the video pipeline
+
+Renders synthetic scenes (PIL images, lavfi audio, captions of varying length)
+through process_scenes without calling OpenAI or Deepgram, and records wall
+time, CPU time, peak RSS and output size per case to a JSON results file.
+
+    python benchmark.py --scenes 1,3,6 --orientations vertical,horizontal --durations 3,8
+    python benchmark.py --output new.json --baseline baseline.json
+    python benchmark.py --engines segments,timeline
+    python benchmark.py --timings audio,script
+
+Each case runs in a fresh subprocess and scratch directory, so caches start
+cold and resource usage is measured per case. With --baseline the exit code is
+1 when any case regresses by more than --threshold.
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parent
+
+# Cycled through per scene to cover square, landscape, portrait and small sources
+IMAGE_SIZES = [(1024, 1024), (1792, 1024), (1024, 1792), (640, 480)]
+AUDIO_SOURCES = ["sine=frequency={frequency}:sample_rate=24000", "anoisesrc=color=pink:sample_rate=24000:amplitude=0.2"]
+CAPTIONS = [
+    "",
+    "A short caption.",
+    "A medium length caption that should wrap onto a second line in vertical videos.",
+    "A long caption with punctuation: commas, colons and 'quotes', written to wrap across "
+    "several lines and exercise the caption layout the way a full voiceover sentence does.",
+]
+# Voiceover length relative to the scene's time range in script-timing cases,
+# cycled per scene so segments get both padded and cut audio
+SCRIPT_AUDIO_RATIOS = [0.8, 1.2]
+COMPARED_METRICS = ["wall_seconds", "cpu_seconds", "peak_rss_mb"]
+
+def case_name(case: dict) -> str:
+    return (
+        f"{case['scenes']}x{case['duration']:g}s-{case['orientation']}-{case['quality']}-"
+        f"{case['engine']}-{case['timing']}"
+    )
+
+def max_rss_mb(who) -> float:
+    # ru_maxrss is kilobytes on Linux and bytes on macOS
+    divisor = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return resource.getrusage(who).ru_maxrss / divisor
+
+def make_scene_assets(workdir: Path, count: int, duration: float, timing: str) -> list:
+    """Write synthetic images and audio under workdir/static and return scene dicts"""
+    from PIL import Image, ImageDraw
+
+    scenes = []
+    for i in range(count):
+        width, height = IMAGE_SIZES[i % len(IMAGE_SIZES)]
+        image = Image.linear_gradient("L").resize((width, height)).convert("RGB")
+        draw = ImageDraw.Draw(image)
+        draw.ellipse((width // 4, height // 4, width * 3 // 4, height * 3 // 4), fill=(40 * i % 255, 120, 200))
+        image_path = workdir / "static" / "images" / f"bench_{i}.webp"
+        image.save(image_path, "WEBP", quality=90)
+
+        audio_path = workdir / "static" / "audio" / f"bench_{i}.mp3"
+        source = AUDIO_SOURCES[i % len(AUDIO_SOURCES)].format(frequency=220 + 40 * i)
+        audio_duration = duration
+        if timing == "script":
+            audio_duration = duration * SCRIPT_AUDIO_RATIOS[i % len(SCRIPT_AUDIO_RATIOS)]
+        subprocess.run(
+            ['ffmpeg', '-y', '-f', 'lavfi', '-i', f"{source}:duration={audio_duration:g}",
+             '-ac', '1', '-c:a', 'libmp3lame', '-b:a', '64k', str(audio_path)],
+            check=True, capture_output=True
+        )
+
+        scenes.append({
+            "imageUrl": f"/static/images/{image_path.name}",
+            "audioUrl": f"/static/audio/{audio_path.name}",
+            "voiceover": CAPTIONS[i % len(CAPTIONS)],
+            "time": f"0-{duration:g}"
+        })
+    return scenes
+
+def run_case(case: dict) -> dict:
+    """Render one case in the current process; called in a fresh subprocess"""
+    workdir = Path(case["workdir"])
+    for name in ("images", "audio", "videos"):
+        (workdir / "static" / name).mkdir(parents=True, exist_ok=True)
+    if case.get("fonts") and Path(case["fonts"]).is_dir():
+        shutil.copytree(case["fonts"], workdir / "static" / "fonts", dirs_exist_ok=True)
+    os.chdir(workdir)
+    os.environ["SCENE_TIMING"] = case["timing"]
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    import logging
+    import ss
+    logging.getLogger(ss.__name__).setLevel(logging.WARNING)
+    ss.init_scene_store()
+    ss.init_image_store()
+    ss.init_probe_cache()
+    ss.segment_cache.init()
+    ss.storage_manager.init()
+
+    scenes = make_scene_assets(workdir, case["scenes"], case["duration"], case["timing"])
+
+    cpu_start = time.process_time()
+    children_start = resource.getrusage(resource.RUSAGE_CHILDREN)
+    wall_start = time.perf_counter()
+    output = ss.process_scenes(
+        scenes, case["orientation"], case["quality"], use_cache=False, engine=case["engine"]
+    )
+    wall_seconds = time.perf_counter() - wall_start
+    children_end = resource.getrusage(resource.RUSAGE_CHILDREN)
+    cpu_seconds = (
+        time.process_time() - cpu_start
+        + (children_end.ru_utime - children_start.ru_utime)
+        + (children_end.ru_stime - children_start.ru_stime)
+    )
+
+    probe = ss.run_ffprobe(output)
+    return {
+        "wall_seconds": round(wall_seconds, 3),
+        "cpu_seconds": round(cpu_seconds, 3),
+        "python_peak_rss_mb": round(max_rss_mb(resource.RUSAGE_SELF), 1),
+        "ffmpeg_peak_rss_mb": round(max_rss_mb(resource.RUSAGE_CHILDREN), 1),
+        "output_bytes": Path(output).stat().st_size,
+        "output_seconds": round(float(probe["format"]["duration"]), 3)
+    }
+
+def run_case_subprocess(case: dict, keep: bool) -> dict:
+    workdir = Path(tempfile.mkdtemp(prefix="autoshorts-bench-"))
+    try:
+        completed = subprocess.run(
+            [sys.executable, __file__, "--run-case", json.dumps({**case, "workdir": str(workdir)})],
+            capture_output=True, text=True
+        )
+        if completed.returncode != 0:
+            raise RuntimeError(f"Case {case_name(case)} failed:\n{completed.stderr[-4000:]}")
+        return json.loads(completed.stdout.strip().splitlines()[-1])
+    finally:
+        if not keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+def summarize(case: dict, runs: list) -> dict:
+    """Median times and worst-case memory over the repeats of one case"""
+    peak_rss = [max(run["python_peak_rss_mb"], run["ffmpeg_peak_rss_mb"]) for run in runs]
+    return {
+        "name": case_name(case),
+        **case,
+        "runs": len(runs),
+        "wall_seconds": round(statistics.median(run["wall_seconds"] for run in runs), 3),
+        "cpu_seconds": round(statistics.median(run["cpu_seconds"] for run in runs), 3),
+        "peak_rss_mb": max(peak_rss),
+        "python_peak_rss_mb": max(run["python_peak_rss_mb"] for run in runs),
+        "ffmpeg_peak_rss_mb": max(run["ffmpeg_peak_rss_mb"] for run in runs),
+        "output_bytes": runs[-1]["output_bytes"],
+        "output_seconds": runs[-1]["output_seconds"],
+        "samples": runs
+    }
+
+def compare_to_baseline(results: dict, baseline: dict, threshold: float) -> list:
+    """Print per-case changes against the baseline and return the regressions"""
+    baseline_cases = {case["name"]: case for case in baseline.get("cases", [])}
+    regressions = []
+    for case in results["cases"]:
+        previous = baseline_cases.get(case["name"])
+        if previous is None:
+            print(f"{case['name']}: no baseline")
+            continue
+        changes = []
+        for metric in COMPARED_METRICS:
+            if not previous.get(metric):
+                continue
+            ratio = case[metric] / previous[metric]
+            changes.append(f"{metric} {previous[metric]:g} -> {case[metric]:g} ({(ratio - 1) * 100:+.1f}%)")
+            if ratio > 1 + threshold:
+                regressions.append({"case": case["name"], "metric": metric,
+                                    "baseline": previous[metric], "current": case[metric]})
+        print(f"{case['name']}: " + ", ".join(changes))
+    return regressions
+
+def ffmpeg_version() -> str:
+    output = subprocess.run(['ffmpeg', '-version'], capture_output=True, text=True).stdout
+    return output.splitlines()[0] if output else "unknown"
+
+def parse_list(value: str, cast=str) -> list:
+    return [cast(item) for item in value.split(",") if item]
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark process_scenes on synthetic scenes")
+    parser.add_argument("--scenes", default="1,3,6", help="Comma-separated scene counts")
+    parser.add_argument("--orientations", default="vertical,horizontal")
+    parser.add_argument("--durations", default="3,8", help="Comma-separated seconds per scene")
+    parser.add_argument("--quality", default="preview", help="Quality profile to render with")
+    parser.add_argument("--engines", default="segments", help="Comma-separated render engines")
+    parser.add_argument("--timings", default="audio,script", help="Comma-separated SCENE_TIMING modes")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per case; times are medians")
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--baseline", help="Earlier results file to compare against")
+    parser.add_argument("--threshold", type=float, default=0.15, help="Allowed slowdown before failing, e.g. 0.15")
+    parser.add_argument("--fonts", default=str(BACKEND_DIR / "static" / "fonts"), help="Caption font directory")
+    parser.add_argument("--keep", action="store_true", help="Keep each case's working directory")
+    parser.add_argument("--run-case", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.run_case:
+        print(json.dumps(run_case(json.loads(args.run_case))))
+        return 0
+
+    cases = [
+        {"scenes": scenes, "orientation": orientation, "duration": duration,
+         "quality": args.quality, "engine": engine, "timing": timing, "fonts": args.fonts}
+        for scenes in parse_list(args.scenes, int)
+        for orientation in parse_list(args.orientations)
+        for duration in parse_list(args.durations, float)
+        for engine in parse_list(args.engines)
+        for timing in parse_list(args.timings)
+    ]
+
+    results = {
+        "created": time.time(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpus": os.cpu_count(),
+        "ffmpeg": ffmpeg_version(),
+        "cases": []
+    }
+    for case in cases:
+        runs = [run_case_subprocess(case, args.keep) for _ in range(args.repeat)]
+        summary = summarize({key: value for key, value in case.items() if key != "fonts"}, runs)
+        results["cases"].append(summary)
+        print(
+            f"{summary['name']}: {summary['wall_seconds']}s wall, {summary['cpu_seconds']}s cpu, "
+            f"{summary['peak_rss_mb']} MB peak, {summary['output_bytes']} bytes"
+        )
+
+    Path(args.output).write_text(json.dumps(results, indent=2))
+    print(f"Results written to {args.output}")
+
+    if args.baseline:
+        regressions = compare_to_baseline(results, json.loads(Path(args.baseline).read_text()), args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regressions over {args.threshold * 100:g}%:")
+            for regression in regressions:
+                print(f"  {regression['case']} {regression['metric']}: "
+                      f"{regression['baseline']} -> {regression['current']}")
+            return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
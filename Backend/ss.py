@@ -1,22 +1,34 @@
 from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse, FileResponse
+from fastapi.responses import JSONResponse, FileResponse, PlainTextResponse
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 import os
-import requests
+import asyncio
+import httpx
+import aiofiles
 import logging
 from pathlib import Path
 from dotenv import load_dotenv
 import math
+import hashlib
+import unicodedata
+import shutil
 import subprocess
 import uuid
 import time
 import openai
 import shlex
-from PIL import Image as PILImage
-from collections import defaultdict
-import datetime
+import signal
+import struct
+from PIL import Image as PILImage, ImageColor, ImageDraw, ImageFont
+from collections import defaultdict, deque
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import json
+import mimetypes
+import sqlite3
+import threading
+from contextlib import contextmanager
 
 # Update logging configuration at the top
 logging.basicConfig(
@@ -36,6 +48,9 @@ load_dotenv()
 IMAGES_DIR = Path("static/images")
 IMAGES_DIR.mkdir(parents=True, exist_ok=True)
 
+THUMBNAILS_DIR = IMAGES_DIR / "thumbnails"
+THUMBNAILS_DIR.mkdir(parents=True, exist_ok=True)
+
 AUDIO_DIR = Path("static/audio")
 AUDIO_DIR.mkdir(parents=True, exist_ok=True)
 
@@ -45,6 +60,20 @@ VIDEOS_DIR.mkdir(parents=True, exist_ok=True)
 FONTS_DIR = Path("static/fonts")
 FONTS_DIR.mkdir(parents=True, exist_ok=True)
 
+# Poster, scene thumbnails and seek-preview sprites, named after their video
+PREVIEWS_DIR = VIDEOS_DIR / "previews"
+PREVIEWS_DIR.mkdir(parents=True, exist_ok=True)
+
+# Progressive HLS renders, one directory of segments and a playlist per job
+STREAMS_DIR = Path("static/streams")
+STREAMS_DIR.mkdir(parents=True, exist_ok=True)
+mimetypes.add_type("application/vnd.apple.mpegurl", ".m3u8")
+
+# Local state (job queue, indexes) lives outside the public static mount
+DATA_DIR = Path("data")
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+DB_PATH = DATA_DIR / "autoshorts.db"
+
 # Video settings
 VIDEO_ORIENTATIONS = {
     "horizontal": {
@@ -57,18 +86,166 @@ VIDEO_ORIENTATIONS = {
     }
 }
 
-VIDEO_QUALITY = "high"  # Options: low, medium, high
+# Encoding profiles selectable per /generate-video request. short_side is the
+# height of horizontal videos and the width of vertical ones.
+QUALITY_PROFILES = {
+    "draft": {
+        "label": "Draft",
+        "short_side": 360,
+        "preset": "ultrafast",
+        "crf": 32,
+        "fps": 15,
+        "audio_bitrate": "64k",
+        "counts_toward_limit": False
+    },
+    "preview": {
+        "label": "Preview",
+        "short_side": 540,
+        "preset": "ultrafast",
+        "crf": 28,
+        "fps": 25,
+        "audio_bitrate": "96k",
+        "counts_toward_limit": False
+    },
+    "final": {
+        "label": "High",
+        "short_side": 1080,
+        "preset": "slow",
+        "crf": 18,  # Lower CRF for better quality (range 0-51, lower is better)
+        "fps": 25,
+        "audio_bitrate": "192k",
+        "counts_toward_limit": True
+    }
+}
+
+# Older quality names map onto the profiles above
+QUALITY_ALIASES = {"low": "draft", "medium": "preview", "high": "final"}
+
+VIDEO_QUALITY = os.getenv("VIDEO_QUALITY", "final")  # Default profile
+
+# How still-image scenes are encoded:
+#   off    - generic x264 settings, every output frame fed to the encoder
+#   tuned  - stillimage tuning, low source frame rate and long GOPs
+#   repeat - encode one short GOP and repeat it to the scene duration
+STILL_IMAGE_MODE = os.getenv("STILL_IMAGE_MODE", "tuned")
+
+# Encoder settings shared by every scene segment, whatever the profile
+SCENE_ENCODER_SETTINGS = {
+    "video_codec": "libx264",
+    "pix_fmt": "yuv420p",
+    "video_timescale": 12800,
+    "still_mode": STILL_IMAGE_MODE,
+    "source_fps": 1,  # Rate the still is fed into the filtergraph before fps conversion
+    "gop_seconds": 10,
+    "repeat_seconds": 1,  # Length of the GOP that repeat mode loops
+    "audio_codec": "aac",
+    "audio_sample_rate": 48000,
+    "audio_channels": 2
+}
+
+# Scene timing: "audio" matches each scene to its voiceover length, "script"
+# uses the scene's time range. Either falls back to the other, then to the default.
+SCENE_TIMING = os.getenv("SCENE_TIMING", "audio")
+DEFAULT_SCENE_DURATION = 5
+
+# Render engines: "segments" encodes each scene separately (cacheable, parallel)
+# and joins them; "timeline" renders every scene and transition in one FFmpeg
+# run with no intermediate files. Requests can pick either with renderEngine.
+RENDER_ENGINES = ("segments", "timeline")
+RENDER_ENGINE = os.getenv("RENDER_ENGINE", "segments")
+TIMELINE_MAX_SCENES = 30  # Inputs per FFmpeg process; longer videos use segments
+MAX_TRANSITION_SECONDS = 2.0  # Crossfades are timeline-only
+MAX_RENDER_TARGETS = 4  # Orientation/quality renditions one /generate-video job may produce
+
+# Publish an HLS playlist that grows as scenes finish, so playback can start
+# before the final MP4 exists. Requests can turn it on with progressive.
+PROGRESSIVE_OUTPUT = os.getenv("PROGRESSIVE_OUTPUT", "false").lower() == "true"
+
+# Parallel rendering settings
+RENDER_MAX_WORKERS = int(os.getenv("RENDER_MAX_WORKERS", str(min(4, os.cpu_count() or 1))))
+RENDER_THREADS_PER_JOB = int(os.getenv("RENDER_THREADS_PER_JOB", "0"))  # 0 = split cores across workers
+RENDER_JOB_WORKERS = int(os.getenv("RENDER_JOB_WORKERS", "1"))  # Videos rendered at the same time
+
+# Upstream HTTP client settings (DALL-E, Deepgram)
+HTTP_CONNECT_TIMEOUT = float(os.getenv("HTTP_CONNECT_TIMEOUT", "10"))
+HTTP_READ_TIMEOUT = float(os.getenv("HTTP_READ_TIMEOUT", "120"))
+HTTP_MAX_CONNECTIONS = int(os.getenv("HTTP_MAX_CONNECTIONS", "50"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("HTTP_MAX_KEEPALIVE", "20"))
+HTTP_CHUNK_SIZE = 64 * 1024
+
+# Concurrent upstream calls per provider, shared by single and batch endpoints
+OPENAI_MAX_CONCURRENCY = int(os.getenv("OPENAI_MAX_CONCURRENCY", "5"))
+DEEPGRAM_MAX_CONCURRENCY = int(os.getenv("DEEPGRAM_MAX_CONCURRENCY", "10"))
+BATCH_MAX_SCENES = 50
+
+# Rendered scene segments are reused across jobs when their inputs don't change
+SEGMENT_CACHE_ENABLED = os.getenv("SEGMENT_CACHE_ENABLED", "true").lower() == "true"
+SEGMENT_CACHE_DIR = DATA_DIR / "segment_cache"
+SEGMENT_CACHE_MAX_BYTES = int(os.getenv("SEGMENT_CACHE_MAX_BYTES", str(5 * 1024 ** 3)))
+SEGMENT_CACHE_VERSION = 1  # Bump when the scene pipeline changes its output
+
+# Upstream generation settings; identical requests reuse earlier results
+IMAGE_MODEL = "dall-e-2"
+IMAGE_SIZE = "1024x1024"
+TTS_MODEL = "aura-asteria-en"
+GENERATION_CACHE_ENABLED = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() == "true"
+GENERATION_CACHE_MAX_BYTES = int(os.getenv("GENERATION_CACHE_MAX_BYTES", str(2 * 1024 ** 3)))
+
+# Scene images are scaled and padded to the video canvas once, then reused
+FRAME_CACHE_DIR = DATA_DIR / "frames"
+FRAME_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
+# Every render gets its own scratch workspace under SCRATCH_ROOT; point it at a
+# tmpfs such as /dev/shm to keep intermediates off disk
+SCRATCH_ROOT = Path(os.getenv("SCRATCH_ROOT", str(DATA_DIR / "scratch")))
+SCRATCH_MIN_FREE_BYTES = int(os.getenv("SCRATCH_MIN_FREE_BYTES", str(256 * 1024 ** 2)))
+SCRATCH_QUOTA_BYTES = int(os.getenv("SCRATCH_QUOTA_BYTES", "0"))  # 0 = only the free-space check
+SCRATCH_BYTES_PER_SECOND = 2 * 1024 ** 2  # Estimated intermediates per second of 1080p video
+SCRATCH_ORPHAN_AGE_SECONDS = int(os.getenv("SCRATCH_ORPHAN_AGE_SECONDS", str(6 * 60 * 60)))
+MAINTENANCE_INTERVAL_SECONDS = int(os.getenv("MAINTENANCE_INTERVAL_SECONDS", "600"))
+
+# FFmpeg runs are killed once they exceed base + per-second * media duration
+FFMPEG_TIMEOUT_BASE_SECONDS = float(os.getenv("FFMPEG_TIMEOUT_BASE_SECONDS", "60"))
+FFMPEG_TIMEOUT_PER_MEDIA_SECOND = float(os.getenv("FFMPEG_TIMEOUT_PER_MEDIA_SECOND", "10"))
+FFMPEG_STDERR_LINES = 200  # Tail of FFmpeg's stderr kept for error logs
+FFPROBE_TIMEOUT_SECONDS = 30
+AV_SYNC_TOLERANCE_SECONDS = 0.2  # Allowed video/audio length difference in a finished render
+PROGRESS_SAVE_INTERVAL_SECONDS = 1.0  # Minimum gap between live progress writes per job
+CANCEL_POLL_INTERVAL_SECONDS = 0.5  # How often a running job re-reads its cancel flag
+
+# Downloaded images are transcoded to WebP with a thumbnail for the UI
+IMAGE_WEBP_QUALITY = int(os.getenv("IMAGE_WEBP_QUALITY", "90"))
+IMAGE_THUMBNAIL_SIZE = 256  # Longest side in pixels
+
+# Video previews are drawn from the normalized scene frames, never decoded from the video
+PREVIEW_THUMBNAIL_WIDTH = 320
+PREVIEW_SPRITE_TILE_WIDTH = 160
+PREVIEW_SPRITE_COLUMNS = 10
+PREVIEW_SPRITE_INTERVAL_SECONDS = 2  # Seek-preview spacing, widened to stay within the tile cap
+PREVIEW_SPRITE_MAX_TILES = 100
+
+# Generated images, audio and videos are indexed so they can be expired without
+# walking the static directories; 0 disables the quota or TTL
+STORAGE_QUOTA_BYTES = int(os.getenv("STORAGE_QUOTA_BYTES", str(20 * 1024 ** 3)))
+STORAGE_ASSET_TTL_SECONDS = int(os.getenv("STORAGE_ASSET_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+STORAGE_SCENE_TTL_SECONDS = int(os.getenv("STORAGE_SCENE_TTL_SECONDS", str(30 * 24 * 60 * 60)))
+STORAGE_MIN_IDLE_SECONDS = 60 * 60  # Never evict an asset used within the last hour
 
 # Font settings for captions
 FONT_FILE = "OpenSans-Bold.ttf"
 FONT_PATH = str(FONTS_DIR / FONT_FILE)
 
+# Captions are laid out once with PIL ("overlay") or drawn per frame by FFmpeg ("drawtext")
+CAPTION_RENDERER = os.getenv("CAPTION_RENDERER", "overlay")
+CAPTION_CACHE_DIR = DATA_DIR / "captions"
+CAPTION_CACHE_DIR.mkdir(parents=True, exist_ok=True)
+
 # Caption settings for different orientations
 CAPTION_SETTINGS = {
     "horizontal": {
         "font_size": 48,
-        "y_position": "(h-text_h-100)",  # 100 pixels from bottom
-        "max_width": "w*0.9",     # 90% of video width
+        "bottom_margin": 100,     # Pixels from the bottom to the caption block
+        "max_width_ratio": 0.9,   # 90% of video width
         "line_spacing": 20,
         "box_opacity": 0.8,
         "box_padding": 15,
@@ -78,8 +255,8 @@ CAPTION_SETTINGS = {
     },
     "vertical": {
         "font_size": 52,          # Larger font for vertical videos
-        "y_position": "(h-text_h-150)",  # 150 pixels from bottom
-        "max_width": "w*0.95",    # 95% of video width for vertical
+        "bottom_margin": 150,     # Pixels from the bottom to the caption block
+        "max_width_ratio": 0.95,  # 95% of video width for vertical
         "line_spacing": 22,
         "box_opacity": 0.85,
         "box_padding": 20,
@@ -89,9 +266,18 @@ CAPTION_SETTINGS = {
     }
 }
 
-# Track video generations per IP
-video_generations = defaultdict(list)
-MAX_GENERATIONS_PER_IP = 2
+# Video generations allowed per rate-limit window, by tier. Requests are "free"
+# unless their X-API-Key maps to another tier in RATE_LIMIT_API_KEYS ("key:tier,...").
+RATE_LIMIT_TIERS = {
+    "free": int(os.getenv("RATE_LIMIT_FREE", "2")),
+    "pro": int(os.getenv("RATE_LIMIT_PRO", "20"))
+}
+RATE_LIMIT_API_KEYS = dict(
+    entry.split(":", 1) for entry in os.getenv("RATE_LIMIT_API_KEYS", "").split(",") if ":" in entry
+)
+RATE_LIMIT_WINDOW_SECONDS = int(os.getenv("RATE_LIMIT_WINDOW_SECONDS", str(24 * 60 * 60)))
+# "memory" is per process; "sqlite" is shared by every worker on the host
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite")
 
 def escape_text_for_ffmpeg(text):
     """Properly escape text for FFmpeg drawtext filter"""
@@ -126,6 +312,167 @@ def format_caption_text(text, max_chars=50):
     # Escape each line and join with literal \n for FFmpeg
     return "\\n".join(escape_text_for_ffmpeg(line) for line in lines)
 
+_db_local = threading.local()
+
+def get_db() -> sqlite3.Connection:
+    """Return this thread's connection to the local SQLite database"""
+    conn = getattr(_db_local, "conn", None)
+    if conn is None:
+        conn = sqlite3.connect(DB_PATH, timeout=30, isolation_level=None)
+        conn.row_factory = sqlite3.Row
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _db_local.conn = conn
+    return conn
+
+@contextmanager
+def db_transaction():
+    """Run a block of statements as one atomic write transaction"""
+    conn = get_db()
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+metrics_registry = []
+
+def format_metric_labels(pairs) -> str:
+    if not pairs:
+        return ""
+    escaped = (
+        '{}="{}"'.format(name, str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n"))
+        for name, value in pairs
+    )
+    return "{" + ",".join(escaped) + "}"
+
+class Metric:
+    """A metric family in the Prometheus text format, with one sample set per label combination"""
+    kind = "untyped"
+    
+    def __init__(self, name: str, help_text: str, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = tuple(labels)
+        self.lock = threading.Lock()
+        self.values = {}
+        if not self.labels and self.kind != "histogram":
+            self.values[()] = 0  # Report unlabelled metrics from the first scrape
+        metrics_registry.append(self)
+    
+    def label_key(self, labels: dict) -> tuple:
+        return tuple(str(labels[name]) for name in self.labels)
+    
+    def samples(self):
+        """Yield (suffix, label pairs, value) for every sample"""
+        with self.lock:
+            values = dict(self.values)
+        for key, value in sorted(values.items()):
+            yield "", list(zip(self.labels, key)), value
+    
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} {self.kind}"]
+        for suffix, pairs, value in self.samples():
+            lines.append(f"{self.name}{suffix}{format_metric_labels(pairs)} {value}")
+        return lines
+
+class Counter(Metric):
+    kind = "counter"
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+class Gauge(Metric):
+    kind = "gauge"
+    
+    def set(self, value: float, **labels):
+        with self.lock:
+            self.values[self.label_key(labels)] = value
+    
+    def inc(self, amount: float = 1, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+    
+    def dec(self, amount: float = 1, **labels):
+        self.inc(-amount, **labels)
+
+class Histogram(Metric):
+    kind = "histogram"
+    
+    def __init__(self, name: str, help_text: str, labels=(),
+                 buckets=(0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300)):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+    
+    def observe(self, value: float, **labels):
+        key = self.label_key(labels)
+        with self.lock:
+            counts, total, count = self.values.get(key, ([0] * len(self.buckets), 0.0, 0))
+            counts = [c + (value <= bound) for c, bound in zip(counts, self.buckets)]
+            self.values[key] = (counts, total + value, count + 1)
+    
+    @contextmanager
+    def time(self, **labels):
+        """Observe the duration of a block, whether or not it raises"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+    
+    def samples(self):
+        with self.lock:
+            values = dict(self.values)
+        for key, (counts, total, count) in sorted(values.items()):
+            pairs = list(zip(self.labels, key))
+            for bound, bucket_count in zip(self.buckets, counts):
+                yield "_bucket", pairs + [("le", f"{bound:g}")], bucket_count
+            yield "_bucket", pairs + [("le", "+Inf")], count
+            yield "_sum", pairs, total
+            yield "_count", pairs, count
+
+# Render pipeline
+RENDER_STAGE_SECONDS = Histogram(
+    "autoshorts_render_stage_seconds",
+    "Time spent in each render stage (scene_encode covers image-to-video and audio mux in one pass)",
+    ["stage"]
+)
+RENDER_JOB_SECONDS = Histogram(
+    "autoshorts_render_job_seconds", "Wall time of finished render jobs", ["status"],
+    buckets=(5, 15, 30, 60, 120, 300, 600, 1200, 1800)
+)
+RENDER_JOBS_TOTAL = Counter("autoshorts_render_jobs_total", "Finished render jobs by outcome", ["status"])
+RENDER_JOBS_IN_FLIGHT = Gauge("autoshorts_render_jobs_in_flight", "Render jobs currently running")
+FFMPEG_FAILURES_TOTAL = Counter("autoshorts_ffmpeg_failures_total", "Failed FFmpeg invocations", ["stage"])
+CAPTION_FALLBACKS_TOTAL = Counter(
+    "autoshorts_caption_fallbacks_total", "Scenes whose captions fell back to drawtext or were dropped", ["to"]
+)
+SEGMENT_CACHE_REQUESTS_TOTAL = Counter(
+    "autoshorts_segment_cache_requests_total", "Segment cache lookups", ["result"]
+)
+GENERATION_CACHE_REQUESTS_TOTAL = Counter(
+    "autoshorts_generation_cache_requests_total", "Image and voiceover requests by cache outcome", ["kind", "result"]
+)
+
+# Upstream APIs
+UPSTREAM_REQUEST_SECONDS = Histogram(
+    "autoshorts_upstream_request_seconds", "Latency of DALL-E and Deepgram calls", ["provider"]
+)
+UPSTREAM_FAILURES_TOTAL = Counter("autoshorts_upstream_failures_total", "Failed upstream calls", ["provider"])
+IMAGE_DOWNLOAD_SECONDS = Histogram("autoshorts_image_download_seconds", "Time to download generated images")
+
+# Disk, refreshed on every scrape
+SCRATCH_BYTES = Gauge("autoshorts_scratch_bytes", "Bytes used by scratch workspaces")
+SCRATCH_RESERVED_BYTES = Gauge("autoshorts_scratch_reserved_bytes", "Bytes reserved by active renders")
+SCRATCH_FREE_BYTES = Gauge("autoshorts_scratch_free_bytes", "Free bytes on the scratch filesystem")
+STORAGE_BYTES = Gauge("autoshorts_storage_bytes", "Bytes of indexed assets", ["kind"])
+SEGMENT_CACHE_BYTES = Gauge("autoshorts_segment_cache_bytes", "Bytes held by the segment cache")
+
 # Check for FFmpeg installation
 try:
     subprocess.run(['ffmpeg', '-version'], capture_output=True, check=True)
@@ -151,177 +498,733 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Scenes generated without a project id share this namespace
+DEFAULT_PROJECT_ID = "default"
+SCENE_REPORT_FILE = Path("static/scene_report.txt")
+
 class ImageRequest(BaseModel):
     prompt: str
+    project_id: str = Field(DEFAULT_PROJECT_ID, alias="projectId", max_length=128)
+    fresh: bool = False  # Skip the generation cache to get a new variation
 
 class TextToSpeechRequest(BaseModel):
     text: str
+    project_id: str = Field(DEFAULT_PROJECT_ID, alias="projectId", max_length=128)
+    fresh: bool = False
+
+# Scene ids are used in generated filenames
+SCENE_ID_PATTERN = r"^[A-Za-z0-9_-]{1,32}$"
+
+class BatchImageScene(BaseModel):
+    id: str = Field(pattern=SCENE_ID_PATTERN)
+    prompt: str = Field(min_length=1)
+    fresh: bool = False
+
+class BatchImageRequest(BaseModel):
+    scenes: list[BatchImageScene] = Field(min_length=1, max_length=BATCH_MAX_SCENES)
+    project_id: str = Field(DEFAULT_PROJECT_ID, alias="projectId", max_length=128)
+
+class BatchVoiceScene(BaseModel):
+    id: str = Field(pattern=SCENE_ID_PATTERN)
+    text: str = Field(min_length=1)
+    fresh: bool = False
+
+class BatchVoiceRequest(BaseModel):
+    scenes: list[BatchVoiceScene] = Field(min_length=1, max_length=BATCH_MAX_SCENES)
+    project_id: str = Field(DEFAULT_PROJECT_ID, alias="projectId", max_length=128)
 
 def get_image_dimensions(image_path):
-    """Get the dimensions of an image file"""
+    """Get the dimensions of an image file, from the ingest record when there is one"""
+    row = get_db().execute(
+        "SELECT width, height FROM images WHERE path = ?", (asset_key(image_path),)
+    ).fetchone()
+    if row is not None:
+        return row["width"], row["height"]
     with PILImage.open(image_path) as img:
         return img.size
 
-def download_image(url: str, filename: str) -> str:
-    """Download image and return local path"""
+http_client = None
+
+def get_http_client() -> httpx.AsyncClient:
+    """Return the shared, connection-pooled client for upstream API calls"""
+    global http_client
+    if http_client is None:
+        http_client = httpx.AsyncClient(
+            timeout=httpx.Timeout(HTTP_READ_TIMEOUT, connect=HTTP_CONNECT_TIMEOUT),
+            limits=httpx.Limits(
+                max_connections=HTTP_MAX_CONNECTIONS,
+                max_keepalive_connections=HTTP_MAX_KEEPALIVE
+            )
+        )
+    return http_client
+
+@app.on_event("shutdown")
+async def close_http_client():
+    global http_client
+    if http_client is not None:
+        await http_client.aclose()
+        http_client = None
+
+async def save_response_stream(response: httpx.Response, filepath: Path):
+    """Write a streamed response body to disk in chunks without blocking the event loop"""
+    try:
+        async with aiofiles.open(filepath, "wb") as f:
+            async for chunk in response.aiter_bytes(HTTP_CHUNK_SIZE):
+                await f.write(chunk)
+    except BaseException:
+        # Don't leave a truncated file behind
+        filepath.unlink(missing_ok=True)
+        raise
+
+async def download_image(url: str, filename: str) -> dict:
+    """Stream an image to disk, then ingest it as WebP; returns the ingest record"""
+    download_path = IMAGES_DIR / f"{filename}.{uuid.uuid4().hex}.download"
+    with IMAGE_DOWNLOAD_SECONDS.time():
+        async with get_http_client().stream("GET", url) as response:
+            response.raise_for_status()
+            await save_response_stream(response, download_path)
+    
+    try:
+        return await asyncio.to_thread(ingest_image, download_path, filename)
+    finally:
+        download_path.unlink(missing_ok=True)
+
+def init_image_store():
+    """Create the table of ingested image dimensions and thumbnails"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS images (
+            path TEXT PRIMARY KEY,
+            width INTEGER NOT NULL,
+            height INTEGER NOT NULL,
+            thumbnail TEXT,
+            created_at REAL NOT NULL
+        )
+    """)
+
+def ingest_image(source_path: Path, filename: str) -> dict:
+    """Transcode a downloaded image to WebP, write its thumbnail and precompute render frames"""
     filepath = IMAGES_DIR / filename
-    response = requests.get(url)
-    response.raise_for_status()
+    thumbnail_path = THUMBNAILS_DIR / filename
+    with PILImage.open(source_path) as img:
+        image = img.convert("RGB")
     
-    with open(filepath, "wb") as f:
-        f.write(response.content)
+    partial_path = filepath.with_name(f"{filename}.{uuid.uuid4().hex}.tmp")
+    image.save(partial_path, "WEBP", quality=IMAGE_WEBP_QUALITY, method=4)
+    os.replace(partial_path, filepath)
     
-    return f"/static/images/{filename}"
-
-def save_scene_info(scene_number: str, image_path: str, audio_path: str):
-    """Save scene information to a report file"""
-    report_file = Path("static/scene_report.txt")
+    thumbnail = image.copy()
+    thumbnail.thumbnail((IMAGE_THUMBNAIL_SIZE, IMAGE_THUMBNAIL_SIZE), PILImage.LANCZOS)
+    thumbnail.save(thumbnail_path, "WEBP", quality=IMAGE_WEBP_QUALITY)
+    
+    width, height = image.size
+    get_db().execute(
+        "INSERT OR REPLACE INTO images (path, width, height, thumbnail, created_at) VALUES (?, ?, ?, ?, ?)",
+        (asset_key(filepath), width, height, asset_key(thumbnail_path), time.time())
+    )
+    # The thumbnail has no references of its own and is evicted with its image
+    storage_manager.register(filepath, "image", filepath.stat().st_size + thumbnail_path.stat().st_size)
+    
+    # Canvas-sized frames for every orientation, so renders never decode the source again
+    for orientation in VIDEO_ORIENTATIONS:
+        render_config = build_render_config(orientation)
+        normalize_scene_image(filepath, render_config["width"], render_config["height"])
     
-    # Convert paths to proper format
+    logger.info(f"Ingested {filename}: {width}x{height}, {filepath.stat().st_size} bytes")
+    return {
+        "path": f"/static/images/{filename}",
+        "thumbnailPath": f"/static/images/thumbnails/{filename}",
+        "width": width,
+        "height": height
+    }
+
+def init_scene_store():
+    """Create the scene table and import the legacy scene report once"""
+    conn = get_db()
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS scenes (
+            project_id TEXT NOT NULL,
+            scene_number TEXT NOT NULL,
+            image_path TEXT,
+            audio_path TEXT,
+            updated_at REAL NOT NULL,
+            PRIMARY KEY (project_id, scene_number)
+        )
+    """)
+    conn.execute("CREATE TABLE IF NOT EXISTS app_meta (key TEXT PRIMARY KEY, value TEXT)")
+    import_scene_report()
+
+def parse_scene_report(content: str) -> dict:
+    """Parse the legacy scene_report.txt format into {scene_number: (image, audio)}"""
+    scenes = {}
+    for section in content.split("-" * 50):
+        lines = section.strip().split("\n")
+        if len(lines) >= 3 and lines[0].startswith("Scene"):
+            scene_number = lines[0].split()[1].strip(":")
+            scenes[scene_number] = (
+                lines[1].replace("Image: ", "").strip(),
+                lines[2].replace("Audio: ", "").strip()
+            )
+    return scenes
+
+def import_scene_report():
+    """One-time import of static/scene_report.txt into the default project"""
+    with db_transaction() as conn:
+        if conn.execute("SELECT 1 FROM app_meta WHERE key = 'scene_report_imported'").fetchone():
+            return
+        imported = 0
+        if SCENE_REPORT_FILE.exists():
+            scenes = parse_scene_report(SCENE_REPORT_FILE.read_text())
+            now = time.time()
+            conn.executemany(
+                "INSERT OR IGNORE INTO scenes (project_id, scene_number, image_path, audio_path, updated_at) "
+                "VALUES (?, ?, ?, ?, ?)",
+                [
+                    (DEFAULT_PROJECT_ID, number, image or None, audio or None, now)
+                    for number, (image, audio) in scenes.items()
+                ]
+            )
+            imported = len(scenes)
+        conn.execute("INSERT INTO app_meta (key, value) VALUES ('scene_report_imported', ?)", (str(time.time()),))
+    if imported:
+        logger.info(f"Imported {imported} scenes from {SCENE_REPORT_FILE}")
+
+SCENE_UPSERT_SQL = """
+    INSERT INTO scenes (project_id, scene_number, image_path, audio_path, updated_at)
+    VALUES (?, ?, ?, ?, ?)
+    ON CONFLICT (project_id, scene_number) DO UPDATE SET
+        image_path = COALESCE(excluded.image_path, scenes.image_path),
+        audio_path = COALESCE(excluded.audio_path, scenes.audio_path),
+        updated_at = excluded.updated_at
+"""
+
+def scene_row(project_id: str, scene_number: str, image_path: str, audio_path: str) -> tuple:
+    """Parameters for SCENE_UPSERT_SQL, with bare filenames converted to static paths"""
     if image_path and not image_path.startswith('/'):
         image_path = f"/static/images/{image_path}"
     if audio_path and not audio_path.startswith('/'):
         audio_path = f"/static/audio/{audio_path}"
+    return project_id, scene_number, image_path or None, audio_path or None, time.time()
+
+def save_scene_info(scene_number: str, image_path: str, audio_path: str,
+                    project_id: str = DEFAULT_PROJECT_ID):
+    """Save scene information, keeping the existing image or audio when one is empty"""
+    get_db().execute(SCENE_UPSERT_SQL, scene_row(project_id, scene_number, image_path, audio_path))
+
+    logger.info(f"Scene store updated for scene {scene_number} in project {project_id}")
+
+def save_scenes_info(scenes, project_id: str = DEFAULT_PROJECT_ID):
+    """Save many (scene_number, image_path, audio_path) mappings in one transaction"""
+    if not scenes:
+        return
+    with db_transaction() as conn:
+        conn.executemany(
+            SCENE_UPSERT_SQL,
+            [scene_row(project_id, *scene) for scene in scenes]
+        )
+    logger.info(f"Scene store updated for {len(scenes)} scenes in project {project_id}")
+
+def asset_key(path) -> str:
+    """Index key for an asset: its path relative to the backend, as served under /static"""
+    return local_asset_path(str(path)).as_posix()
+
+class StorageManager:
+    """Index of generated assets with quota and TTL eviction of unreferenced files
     
-    # Read existing content
-    content = ""
-    if report_file.exists():
-        with open(report_file, "r") as f:
-            content = f.read()
+    Scenes reference their image and audio through the scenes table; a scene
+    counts as live until it goes STORAGE_SCENE_TTL_SECONDS without an update.
+    Jobs reference their inputs through asset_refs until they finish.
+    """
     
-    # Split into sections and filter out empty sections
-    sections = [s.strip() for s in content.split("-" * 50) if s.strip()]
+    def __init__(self, directories: dict, quota_bytes: int, ttl_seconds: int, scene_ttl_seconds: int):
+        self.directories = directories  # kind -> directory
+        self.quota_bytes = quota_bytes
+        self.ttl_seconds = ttl_seconds
+        self.scene_ttl_seconds = scene_ttl_seconds
+        self.lock = threading.Lock()
+        self.pending_access = {}  # Last-access times not yet written to the index
+        self.evictions = 0
+        self.evicted_bytes = 0
+        self.last_sweep = None
     
-    # Create a dictionary of existing scenes
-    scene_dict = {}
-    for section in sections:
-        lines = section.strip().split("\n")
-        if lines and lines[0].startswith("Scene"):
-            curr_scene = lines[0].split()[1].strip(":")
-            scene_dict[curr_scene] = {
-                "image": lines[1].replace("Image: ", ""),
-                "audio": lines[2].replace("Audio: ", "")
-            }
+    def init(self):
+        conn = get_db()
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS assets (
+                path TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_assets_lru ON assets (last_access)")
+        conn.execute("""
+            CREATE TABLE IF NOT EXISTS asset_refs (
+                path TEXT NOT NULL,
+                ref_type TEXT NOT NULL,
+                ref_id TEXT NOT NULL,
+                PRIMARY KEY (path, ref_type, ref_id)
+            )
+        """)
+        conn.execute("CREATE INDEX IF NOT EXISTS idx_asset_refs_owner ON asset_refs (ref_type, ref_id)")
+        self.import_existing()
     
-    # Update or add new scene
-    if scene_number in scene_dict:
-        if image_path:
-            scene_dict[scene_number]["image"] = image_path
-        if audio_path:
-            scene_dict[scene_number]["audio"] = audio_path
-    else:
-        scene_dict[scene_number] = {
-            "image": image_path,
-            "audio": audio_path
+    def import_existing(self):
+        """One-time index of files that were written before the index existed"""
+        conn = get_db()
+        if conn.execute("SELECT 1 FROM app_meta WHERE key = 'assets_imported'").fetchone():
+            return
+        rows = []
+        for kind, directory in self.directories.items():
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file():
+                        stat = entry.stat()
+                        rows.append((asset_key(Path(directory) / entry.name), kind, stat.st_size,
+                                     stat.st_mtime, stat.st_mtime))
+        with db_transaction() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO assets (path, kind, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+                rows
+            )
+            conn.execute("INSERT OR REPLACE INTO app_meta (key, value) VALUES ('assets_imported', ?)",
+                         (str(time.time()),))
+        if rows:
+            logger.info(f"Indexed {len(rows)} existing assets")
+    
+    def register(self, path, kind: str, size: int = None):
+        """Add a newly written file to the index; size may include files derived from it"""
+        path = Path(path)
+        now = time.time()
+        get_db().execute(
+            "INSERT OR REPLACE INTO assets (path, kind, size, created_at, last_access) VALUES (?, ?, ?, ?, ?)",
+            (asset_key(path), kind, path.stat().st_size if size is None else size, now, now)
+        )
+    
+    def touch(self, path, write_through: bool = False):
+        """Record an access; buffered in memory and written by flush_access
+        
+        Renders pass write_through for the files they are about to read, since
+        a sweep in another worker process can't see this process's buffer.
+        """
+        if write_through:
+            get_db().execute(
+                "UPDATE assets SET last_access = MAX(last_access, ?) WHERE path = ?",
+                (time.time(), asset_key(path))
+            )
+            return
+        with self.lock:
+            self.pending_access[asset_key(path)] = time.time()
+    
+    def flush_access(self):
+        with self.lock:
+            pending, self.pending_access = self.pending_access, {}
+        if pending:
+            with db_transaction() as conn:
+                conn.executemany(
+                    "UPDATE assets SET last_access = MAX(last_access, ?) WHERE path = ?",
+                    [(accessed, path) for path, accessed in pending.items()]
+                )
+    
+    def add_references(self, conn, ref_type: str, ref_id: str, paths):
+        """Mark assets as in use by a job; run inside the transaction that creates it"""
+        conn.executemany(
+            "INSERT OR IGNORE INTO asset_refs (path, ref_type, ref_id) VALUES (?, ?, ?)",
+            [(asset_key(path), ref_type, ref_id) for path in paths]
+        )
+    
+    def release_references(self, ref_type: str, ref_id: str):
+        get_db().execute("DELETE FROM asset_refs WHERE ref_type = ? AND ref_id = ?", (ref_type, ref_id))
+    
+    def sweep(self) -> int:
+        """Expire stale scenes, then evict unreferenced assets past the TTL or over the quota"""
+        self.flush_access()
+        now = time.time()
+        idle_before = now - STORAGE_MIN_IDLE_SECONDS
+        removed = []
+        with db_transaction() as conn:
+            if self.scene_ttl_seconds:
+                conn.execute("DELETE FROM scenes WHERE updated_at < ?", (now - self.scene_ttl_seconds,))
+            # Drop references left behind by jobs that ended without releasing them
+            conn.execute(
+                "DELETE FROM asset_refs WHERE ref_type = 'job' AND ref_id NOT IN "
+                "(SELECT id FROM render_jobs WHERE status IN ('queued', 'running'))"
+            )
+            candidates = conn.execute(
+                """
+                SELECT path, kind, size, last_access FROM assets
+                WHERE last_access < ?
+                  AND path NOT IN (SELECT path FROM asset_refs)
+                  AND path NOT IN (SELECT ltrim(image_path, '/') FROM scenes WHERE image_path IS NOT NULL)
+                  AND path NOT IN (SELECT ltrim(audio_path, '/') FROM scenes WHERE audio_path IS NOT NULL)
+                ORDER BY last_access
+                """,
+                (idle_before,)
+            ).fetchall()
+            total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM assets").fetchone()[0]
+            expire_before = now - self.ttl_seconds if self.ttl_seconds else 0
+            for row in candidates:
+                over_quota = self.quota_bytes and total > self.quota_bytes
+                if not over_quota and row["last_access"] >= expire_before:
+                    break
+                conn.execute("DELETE FROM assets WHERE path = ?", (row["path"],))
+                removed.append(row)
+                total -= row["size"]
+            
+            # Ingested images take their thumbnail with them, rendered videos their previews
+            doomed = [row["path"] for row in removed]
+            for video in [row for row in removed if row["kind"] == "video"]:
+                doomed.extend(PREVIEWS_DIR.glob(f"{Path(video['path']).stem}_*"))
+            for image in [row for row in removed if row["kind"] == "image"]:
+                thumbnail = conn.execute("SELECT thumbnail FROM images WHERE path = ?", (image["path"],)).fetchone()
+                if thumbnail is not None:
+                    conn.execute("DELETE FROM images WHERE path = ?", (image["path"],))
+                    if thumbnail["thumbnail"]:
+                        doomed.append(thumbnail["thumbnail"])
+        
+        # Files go after the commit; a failed delete only leaves an unindexed file
+        for path in doomed:
+            try:
+                Path(path).unlink(missing_ok=True)
+            except OSError as e:
+                logger.warning(f"Could not delete {path}: {str(e)}")
+        # Streams are indexed by their playlist and take their segments with them
+        for stream in [row for row in removed if row["kind"] == "stream"]:
+            shutil.rmtree(Path(stream["path"]).parent, ignore_errors=True)
+        with self.lock:
+            self.evictions += len(removed)
+            self.evicted_bytes += sum(row["size"] for row in removed)
+            self.last_sweep = now
+        if removed:
+            logger.info(f"Evicted {len(removed)} assets ({sum(row['size'] for row in removed)} bytes)")
+        if self.quota_bytes and total > self.quota_bytes:
+            logger.warning(f"Storage still over quota after eviction: {total} of {self.quota_bytes} bytes")
+        return len(removed)
+    
+    def stats(self) -> dict:
+        conn = get_db()
+        by_kind = {
+            row["kind"]: {"files": row["files"], "sizeBytes": row["size"]}
+            for row in conn.execute(
+                "SELECT kind, COUNT(*) AS files, COALESCE(SUM(size), 0) AS size FROM assets GROUP BY kind"
+            )
         }
+        referenced = conn.execute(
+            """
+            SELECT COUNT(*) AS files, COALESCE(SUM(size), 0) AS size FROM assets
+            WHERE path IN (SELECT path FROM asset_refs)
+               OR path IN (SELECT ltrim(image_path, '/') FROM scenes WHERE image_path IS NOT NULL)
+               OR path IN (SELECT ltrim(audio_path, '/') FROM scenes WHERE audio_path IS NOT NULL)
+            """
+        ).fetchone()
+        with self.lock:
+            return {
+                "sizeBytes": sum(kind["sizeBytes"] for kind in by_kind.values()),
+                "quotaBytes": self.quota_bytes,
+                "ttlSeconds": self.ttl_seconds,
+                "byKind": by_kind,
+                "referenced": {"files": referenced["files"], "sizeBytes": referenced["size"]},
+                "evictions": self.evictions,
+                "evictedBytes": self.evicted_bytes,
+                "lastSweep": self.last_sweep
+            }
+
+storage_manager = StorageManager(
+    {"image": IMAGES_DIR, "audio": AUDIO_DIR, "video": VIDEOS_DIR, "frame": FRAME_CACHE_DIR, "caption": CAPTION_CACHE_DIR},
+    STORAGE_QUOTA_BYTES, STORAGE_ASSET_TTL_SECONDS, STORAGE_SCENE_TTL_SECONDS
+)
+
+@app.middleware("http")
+async def track_static_access(request: Request, call_next):
+    """Refresh last-access for files served from /static"""
+    response = await call_next(request)
+    if request.url.path.startswith("/static/") and response.status_code < 400:
+        storage_manager.touch(request.url.path)
+        # Rendered files never change under their name; live playlists do
+        if request.url.path.endswith(".m3u8"):
+            response.headers["Cache-Control"] = "no-cache"
+        elif request.url.path.startswith(("/static/videos/", "/static/streams/")):
+            response.headers["Cache-Control"] = "public, max-age=31536000, immutable"
+    return response
+
+provider_limits = {
+    "openai": asyncio.Semaphore(OPENAI_MAX_CONCURRENCY),
+    "deepgram": asyncio.Semaphore(DEEPGRAM_MAX_CONCURRENCY)
+}
+
+def scene_number_from_text(text: str) -> str:
+    """Guess the scene number from a "Scene N" prefix, for clients that don't send one"""
+    scene_number = '1'
+    if 'Scene' in text:
+        try:
+            scene_text = text.split('Scene')[1].strip()
+            scene_number = scene_text.split()[0]
+        except:
+            pass
+    return scene_number
+
+async def create_scene_image(prompt: str) -> tuple:
+    """Generate an image with DALL-E and ingest it; returns (filename, ingest record)"""
+    filename = f"image_{uuid.uuid4()}.webp"
+    
+    async with provider_limits["openai"]:
+        try:
+            with UPSTREAM_REQUEST_SECONDS.time(provider="dalle"):
+                response = await get_http_client().post(
+                    "https://api.openai.com/v1/images/generations",
+                    headers={
+                        "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
+                        "Content-Type": "application/json"
+                    },
+                    json={
+                        "model": IMAGE_MODEL,
+                        "prompt": prompt,
+                        "n": 1,
+                        "size": IMAGE_SIZE,
+                        "response_format": "url"
+                    }
+                )
+        except httpx.HTTPError:
+            UPSTREAM_FAILURES_TOTAL.inc(provider="dalle")
+            raise
+    
+    if response.status_code != 200:
+        UPSTREAM_FAILURES_TOTAL.inc(provider="dalle")
+        logger.error(f"DALL-E API error: {response.text}")
+        raise HTTPException(status_code=500, detail="Failed to generate image with DALL-E")
+    
+    image_url = response.json()['data'][0]['url']
+    
+    # Download and save the image
+    ingested = await download_image(image_url, filename)
+    logger.info(f"Image saved locally at: {IMAGES_DIR / filename}")
+    return filename, ingested
+
+async def create_scene_audio(text: str) -> str:
+    """Synthesize a voiceover with Deepgram and return the audio filename"""
+    # No scene number in the name: cached voiceovers are shared by any scene with the same text
+    filename = f"audio_{uuid.uuid4()}.mp3"
+    filepath = AUDIO_DIR / filename
     
-    # Sort scenes by number and create new content
-    sorted_scenes = sorted(scene_dict.keys(), key=lambda x: int(x))
-    new_content = []
+    # Setup Deepgram request
+    DEEPGRAM_URL = f"https://api.deepgram.com/v1/speak?model={TTS_MODEL}"
+    headers = {
+        "Authorization": f"Token {DEEPGRAM_API_KEY}",
+        "Content-Type": "application/json"
+    }
     
-    for scene in sorted_scenes:
-        new_content.extend([
-            f"Scene {scene}:",
-            f"Image: {scene_dict[scene]['image']}",
-            f"Audio: {scene_dict[scene]['audio']}"
-        ])
-        new_content.append("-" * 50)
+    # Generate and save audio
+    async with provider_limits["deepgram"]:
+        try:
+            with UPSTREAM_REQUEST_SECONDS.time(provider="deepgram"):
+                async with get_http_client().stream(
+                    "POST",
+                    DEEPGRAM_URL,
+                    headers=headers,
+                    json={"text": text}
+                ) as response:
+                    if response.is_error:
+                        await response.aread()
+                        logger.error(f"Deepgram API error: {response.text}")
+                        raise HTTPException(status_code=500, detail="Failed to generate audio")
+                    
+                    await save_response_stream(response, filepath)
+        except (httpx.HTTPError, HTTPException):
+            UPSTREAM_FAILURES_TOTAL.inc(provider="deepgram")
+            raise
     
-    # Write back to file
-    with open(report_file, "w") as f:
-        f.write("\n".join(new_content) + "\n")
+    storage_manager.register(filepath, "audio")
+    logger.info(f"Audio saved as {filename}")
+    return filename
 
-    logger.info(f"Scene report updated for scene {scene_number}")
+def normalize_generation_text(text: str) -> str:
+    """Collapse whitespace and Unicode variants so trivially different requests share a key"""
+    return " ".join(unicodedata.normalize("NFC", text).split())
 
-def get_scene_paths(scene_number: str) -> tuple:
-    """Get image and audio paths for a scene from the report"""
-    report_file = Path("static/scene_report.txt")
+def generation_cache_key(kind: str, text: str, model: str, variant: str) -> str:
+    """Cache key for a generation request: normalized text, model and voice or size"""
+    return hashlib.sha256(json.dumps({
+        "kind": kind,
+        "text": normalize_generation_text(text),
+        "model": model,
+        "variant": variant
+    }, sort_keys=True).encode()).hexdigest()
+
+class GenerationCache:
+    """Reuses generated images and voiceovers for identical requests, with size-bounded LRU eviction
+    
+    Concurrent identical requests share one upstream call. Evicting an entry
+    only forgets it; the file stays until the storage manager finds it unreferenced.
+    """
+    
+    def __init__(self, enabled: bool, max_bytes: int):
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.in_flight = {}  # key -> task generating it
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+    
+    def init(self):
+        get_db().execute("""
+            CREATE TABLE IF NOT EXISTS generation_cache (
+                key TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                path TEXT NOT NULL,
+                result TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        get_db().execute("CREATE INDEX IF NOT EXISTS idx_generation_cache_lru ON generation_cache (last_used)")
+    
+    def lookup(self, key: str):
+        """Return the stored result for key, or None if it's unknown or its file is gone"""
+        conn = get_db()
+        with self.lock:
+            row = conn.execute("SELECT path, result FROM generation_cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if not Path(row["path"]).exists():
+                conn.execute("DELETE FROM generation_cache WHERE key = ?", (key,))
+                return None
+            conn.execute("UPDATE generation_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+        storage_manager.touch(row["path"])
+        return json.loads(row["result"])
+    
+    def store(self, key: str, kind: str, path: Path, result: dict):
+        now = time.time()
+        with self.lock:
+            get_db().execute(
+                "INSERT OR REPLACE INTO generation_cache (key, kind, path, result, size, created_at, last_used) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (key, kind, str(path), json.dumps(result), path.stat().st_size, now, now)
+            )
+            self._evict()
     
-    if not report_file.exists():
-        raise Exception("Scene report file not found")
+    def _evict(self):
+        conn = get_db()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM generation_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute("SELECT key, size FROM generation_cache ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM generation_cache WHERE key = ?", (row["key"],))
+            total -= row["size"]
+            self.evictions += 1
+    
+    async def get_or_create(self, key: str, kind: str, create, fresh: bool = False) -> dict:
+        """Return the result for key, running create() at most once across concurrent callers
+        
+        create is an async callable returning (path, result). fresh skips the
+        lookup and replaces the entry with a new generation.
+        """
+        if not self.enabled:
+            return (await create())[1]
+        
+        if not fresh:
+            result = self.lookup(key)
+            if result is not None:
+                self.hits += 1
+                GENERATION_CACHE_REQUESTS_TOTAL.inc(kind=kind, result="hit")
+                return result
+            task = self.in_flight.get(key)
+            if task is not None:
+                self.coalesced += 1
+                GENERATION_CACHE_REQUESTS_TOTAL.inc(kind=kind, result="coalesced")
+                return await asyncio.shield(task)
+        
+        self.misses += 1
+        GENERATION_CACHE_REQUESTS_TOTAL.inc(kind=kind, result="miss")
         
-    with open(report_file, "r") as f:
-        content = f.read()
+        async def generate():
+            path, result = await create()
+            self.store(key, kind, Path(path), result)
+            return result
         
-    # Find the section for this scene
-    scene_marker = f"Scene {scene_number}:"
-    sections = content.split("-" * 50)
+        task = asyncio.ensure_future(generate())
+        if not fresh:
+            self.in_flight[key] = task
+            task.add_done_callback(lambda _: self.in_flight.pop(key, None))
+        # Shielded so a disconnecting client doesn't cancel the call for the others
+        return await asyncio.shield(task)
     
-    for section in sections:
-        if scene_marker in section:
-            lines = section.strip().split("\n")
-            image_path = lines[1].replace("Image: ", "")
-            audio_path = lines[2].replace("Audio: ", "")
-            return image_path, audio_path
-            
-    raise Exception(f"Scene {scene_number} not found in report")
+    def stats(self) -> dict:
+        row = get_db().execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS size FROM generation_cache"
+        ).fetchone()
+        return {
+            "enabled": self.enabled,
+            "entries": row["entries"],
+            "sizeBytes": row["size"],
+            "maxBytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions
+        }
+
+generation_cache = GenerationCache(GENERATION_CACHE_ENABLED, GENERATION_CACHE_MAX_BYTES)
+
+async def generate_scene_image(prompt: str, fresh: bool = False) -> tuple:
+    """create_scene_image behind the generation cache; returns (filename, ingest record)"""
+    async def create():
+        filename, ingested = await create_scene_image(prompt)
+        return IMAGES_DIR / filename, {"filename": filename, "ingested": ingested}
+    
+    key = generation_cache_key("image", prompt, IMAGE_MODEL, IMAGE_SIZE)
+    result = await generation_cache.get_or_create(key, "image", create, fresh)
+    return result["filename"], result["ingested"]
+
+async def generate_scene_audio(text: str, fresh: bool = False) -> str:
+    """create_scene_audio behind the generation cache; returns the audio filename"""
+    async def create():
+        filename = await create_scene_audio(text)
+        return AUDIO_DIR / filename, {"filename": filename}
+    
+    key = generation_cache_key("audio", text, TTS_MODEL, "")
+    result = await generation_cache.get_or_create(key, "audio", create, fresh)
+    return result["filename"]
+
+def image_response(filename: str, ingested: dict) -> dict:
+    return {
+        "imageUrl": f"http://localhost:8000/static/images/{filename}",
+        "imagePath": f"/static/images/{filename}",
+        "thumbnailUrl": f"http://localhost:8000{ingested['thumbnailPath']}",
+        "width": ingested["width"],
+        "height": ingested["height"]
+    }
+
+def audio_response(filename: str, scene_number: str) -> dict:
+    return {
+        "audioUrl": f"http://localhost:8000/static/audio/{filename}",
+        "audioPath": f"/static/audio/{filename}",
+        "sceneNumber": scene_number
+    }
 
 @app.post("/generate-image")
 async def generate_image(request: ImageRequest):
     try:
         logger.info(f"Received prompt: {request.prompt}")
+        scene_number = scene_number_from_text(request.prompt)
         
-        # Extract scene number
-        scene_number = '1'
-        if 'Scene' in request.prompt:
-            try:
-                scene_text = request.prompt.split('Scene')[1].strip()
-                scene_number = scene_text.split()[0]
-            except:
-                pass
-
-        # Generate random filename
-        filename = f"image_{uuid.uuid4()}.webp"
-        filepath = IMAGES_DIR / filename
-        
-        # Generate image using OpenAI DALL-E
         try:
-            response = requests.post(
-                "https://api.openai.com/v1/images/generations",
-                headers={
-                    "Authorization": f"Bearer {os.getenv('OPENAI_API_KEY')}",
-                    "Content-Type": "application/json"
-                },
-                json={
-                    "model": "dall-e-2",
-                    "prompt": request.prompt,
-                    "n": 1,
-                    "size": "1024x1024",
-                    "response_format": "url"
-                }
-            )
-            
-            if response.status_code != 200:
-                logger.error(f"DALL-E API error: {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to generate image with DALL-E")
-                
-            result = response.json()
-            image_url = result['data'][0]['url']
-            
-            # Download and save the image
-            image_response = requests.get(image_url)
-            image_response.raise_for_status()
-            
-            with open(filepath, "wb") as f:
-                f.write(image_response.content)
-                
-            logger.info(f"Image saved locally at: {filepath}")
-            
-            local_url = f"/static/images/{filename}"
-            try:
-                save_scene_info(scene_number, filename, "")
-                logger.info(f"Scene {scene_number} info saved to report")
-            except Exception as e:
-                logger.error(f"Error saving scene info: {str(e)}")
-
-            return JSONResponse({
-                "imageUrl": f"http://localhost:8000/static/images/{filename}",
-                "imagePath": f"/static/images/{filename}"
-            })
-
+            filename, ingested = await generate_scene_image(request.prompt, request.fresh)
         except Exception as e:
             logger.error(f"Error with DALL-E API: {str(e)}")
             raise HTTPException(status_code=500, detail=str(e))
+        
+        try:
+            save_scene_info(scene_number, filename, "", request.project_id)
+            logger.info(f"Scene {scene_number} info saved to scene store")
+        except Exception as e:
+            logger.error(f"Error saving scene info: {str(e)}")
+
+        return JSONResponse(image_response(filename, ingested))
 
     except Exception as e:
         logger.error(f"Error generating image: {str(e)}")
@@ -330,77 +1233,78 @@ async def generate_image(request: ImageRequest):
 @app.post("/generate-voice")
 async def generate_voice(request: TextToSpeechRequest):
     try:
-        # Extract scene number
-        scene_number = '1'
-        if 'Scene' in request.text:
-            try:
-                scene_text = request.text.split('Scene')[1].strip()
-                scene_number = scene_text.split()[0]
-            except:
-                pass
-
-        # Generate filename for this scene's audio
-        filename = f"audio_scene{scene_number}_{uuid.uuid4()}.mp3"
-        filepath = AUDIO_DIR / filename
+        scene_number = scene_number_from_text(request.text)
 
         # Extract the voiceover text
         voiceover_text = request.text
         if 'Voiceover\n' in voiceover_text:
             voiceover_text = voiceover_text.split('Voiceover\n')[1].strip()
-        else:
-            voiceover_text = request.text
-
-        # Setup Deepgram request
-        DEEPGRAM_URL = "https://api.deepgram.com/v1/speak?model=aura-asteria-en"
-        headers = {
-            "Authorization": f"Token {DEEPGRAM_API_KEY}",
-            "Content-Type": "application/json"
-        }
-        
-        # Generate and save audio
-        with open(filepath, 'wb') as file_stream:
-            response = requests.post(
-                DEEPGRAM_URL, 
-                headers=headers, 
-                json={"text": voiceover_text}, 
-                stream=True
-            )
-            
-            if not response.ok:
-                logger.error(f"Deepgram API error: {response.text}")
-                raise HTTPException(status_code=500, detail="Failed to generate audio")
-
-            for chunk in response.iter_content(chunk_size=1024):
-                if chunk:
-                    file_stream.write(chunk)
 
-        logger.info(f"Audio saved for scene {scene_number} as {filename}")
+        filename = await generate_scene_audio(voiceover_text, request.fresh)
 
         # Update scene information with audio path
         try:
-            # Get existing scene info
-            image_path, _ = get_scene_paths(scene_number)
-            # Update audio path
             save_scene_info(
                 scene_number=scene_number,
-                image_path=image_path.split('/')[-1] if image_path else "",
-                audio_path=filename
+                image_path="",
+                audio_path=filename,
+                project_id=request.project_id
             )
             logger.info(f"Scene {scene_number} updated with audio: {filename}")
         except Exception as e:
-            logger.error(f"Could not update scene report: {str(e)}")
+            logger.error(f"Could not update scene store: {str(e)}")
             raise
 
-        return JSONResponse({
-            "audioUrl": f"http://localhost:8000/static/audio/{filename}",
-            "audioPath": f"/static/audio/{filename}",
-            "sceneNumber": scene_number
-        })
+        return JSONResponse(audio_response(filename, scene_number))
 
     except Exception as e:
         logger.error(f"Error generating voice: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def batch_error(error: Exception) -> str:
+    return error.detail if isinstance(error, HTTPException) else str(error)
+
+@app.post("/batch/generate-images")
+async def batch_generate_images(request: BatchImageRequest):
+    """Generate images for many scenes concurrently; failures are reported per scene"""
+    outcomes = await asyncio.gather(
+        *(generate_scene_image(scene.prompt, scene.fresh) for scene in request.scenes),
+        return_exceptions=True
+    )
+    
+    results, mappings = [], []
+    for scene, outcome in zip(request.scenes, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Batch image for scene {scene.id} failed: {batch_error(outcome)}")
+            results.append({"sceneId": scene.id, "error": batch_error(outcome)})
+            continue
+        filename, ingested = outcome
+        mappings.append((scene.id, filename, ""))
+        results.append({"sceneId": scene.id, **image_response(filename, ingested)})
+    
+    save_scenes_info(mappings, request.project_id)
+    return {"results": results}
+
+@app.post("/batch/generate-voices")
+async def batch_generate_voices(request: BatchVoiceRequest):
+    """Synthesize voiceovers for many scenes concurrently; failures are reported per scene"""
+    outcomes = await asyncio.gather(
+        *(generate_scene_audio(scene.text, scene.fresh) for scene in request.scenes),
+        return_exceptions=True
+    )
+    
+    results, mappings = [], []
+    for scene, outcome in zip(request.scenes, outcomes):
+        if isinstance(outcome, Exception):
+            logger.error(f"Batch voice for scene {scene.id} failed: {batch_error(outcome)}")
+            results.append({"sceneId": scene.id, "error": batch_error(outcome)})
+            continue
+        mappings.append((scene.id, "", outcome))
+        results.append({"sceneId": scene.id, **audio_response(outcome, scene.id)})
+    
+    save_scenes_info(mappings, request.project_id)
+    return {"results": results}
+
 @app.get("/health")
 async def health_check():
     return {"status": "healthy"}
@@ -414,357 +1318,2302 @@ def log_ffmpeg_error(error: subprocess.CalledProcessError, stage: str):
     logger.error(f"Standard output: {error.stdout.decode() if error.stdout else 'No standard output'}")
     logger.error(f"Return code: {error.returncode}")
 
+class FFmpegError(subprocess.CalledProcessError):
+    """FFmpeg exited with an error; stderr holds only the tail of its output"""
+
+class FFmpegTimeout(FFmpegError):
+    """FFmpeg ran past its wall-clock limit and was killed"""
+
+def ffmpeg_timeout(duration=None) -> float:
+    """Wall-clock limit for an FFmpeg run producing duration seconds of media"""
+    return FFMPEG_TIMEOUT_BASE_SECONDS + FFMPEG_TIMEOUT_PER_MEDIA_SECOND * (duration or 0)
+
+def kill_process_tree(process: subprocess.Popen):
+    try:
+        if os.name == "posix":
+            os.killpg(process.pid, signal.SIGKILL)
+        else:
+            process.kill()
+    except ProcessLookupError:
+        pass
+
+def read_ffmpeg_progress(stream, duration, on_progress):
+    """Parse -progress key=value blocks, calling on_progress(percent, speed) after each one"""
+    block = {}
+    for raw_line in stream:
+        key, _, value = raw_line.decode(errors="replace").strip().partition("=")
+        block[key] = value
+        if key != "progress":
+            continue
+        if on_progress is not None:
+            percent = None
+            try:
+                seconds = int(block.get("out_time_us") or block.get("out_time_ms")) / 1_000_000
+            except (TypeError, ValueError):
+                seconds = None
+            if value == "end":
+                percent = 100.0
+            elif seconds is not None and duration:
+                percent = min(99.9, max(0.0, seconds / duration * 100))
+            try:
+                speed = float(block.get("speed", "").rstrip("x"))
+            except ValueError:
+                speed = None
+            try:
+                on_progress(percent, speed)
+            except Exception as e:
+                logger.warning(f"Progress callback failed: {str(e)}")
+        block = {}
+
+def run_ffmpeg(cmd: list, duration=None, cancel_event=None, on_progress=None, timeout=None):
+    """Run an FFmpeg command with live progress, a wall-clock limit and cancellation
+    
+    Raises FFmpegError (a CalledProcessError) if FFmpeg fails, FFmpegTimeout once
+    it runs past timeout (by default scaled to duration) and RenderCancelled when
+    cancel_event is set. The process group is killed in the last two cases.
+    """
+    timeout = timeout or ffmpeg_timeout(duration)
+    full_cmd = [cmd[0], '-nostats', '-progress', 'pipe:1', *cmd[1:]]
+    stderr_tail = deque(maxlen=FFMPEG_STDERR_LINES)
+    process = subprocess.Popen(
+        full_cmd, stdin=subprocess.DEVNULL, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+        start_new_session=(os.name == "posix")
+    )
+    readers = [
+        threading.Thread(target=read_ffmpeg_progress, args=(process.stdout, duration, on_progress), daemon=True),
+        threading.Thread(target=stderr_tail.extend, args=(process.stderr,), daemon=True)
+    ]
+    for reader in readers:
+        reader.start()
+    
+    deadline = time.monotonic() + timeout
+    stopped = None
+    try:
+        while True:
+            try:
+                process.wait(timeout=0.25)
+                break
+            except subprocess.TimeoutExpired:
+                pass
+            if cancel_event is not None and cancel_event.is_set():
+                stopped = "cancelled"
+                break
+            if time.monotonic() > deadline:
+                stopped = "timeout"
+                break
+    finally:
+        if process.poll() is None:
+            kill_process_tree(process)
+            process.wait()
+        for reader in readers:
+            reader.join(timeout=5)
+        process.stdout.close()
+        process.stderr.close()
+    
+    if stopped == "cancelled":
+        raise RenderCancelled()
+    stderr = b"".join(stderr_tail)
+    if stopped == "timeout":
+        raise FFmpegTimeout(
+            process.returncode, full_cmd,
+            stderr=stderr + f"\nKilled after exceeding the {timeout:.0f}s time limit".encode()
+        )
+    if process.returncode != 0:
+        raise FFmpegError(process.returncode, full_cmd, stderr=stderr)
+
 # Add this helper function at the top level, after the other utility functions
 def extract_seconds(time_str):
     """Extract seconds from a time string that might include 'seconds' or other text"""
     # Remove "seconds" and any other non-digit characters
     return int(''.join(filter(str.isdigit, time_str)))
 
-def can_generate_video(ip_address: str) -> bool:
-    """Check if an IP can generate more videos"""
-    today = datetime.datetime.now().date()
-    # Clean up old entries
-    video_generations[ip_address] = [
-        timestamp for timestamp in video_generations[ip_address]
-        if timestamp.date() == today
-    ]
-    return len(video_generations[ip_address]) < MAX_GENERATIONS_PER_IP
+def current_window_start(window_seconds: int) -> int:
+    """Start of the fixed rate-limit window containing now"""
+    return int(time.time() // window_seconds * window_seconds)
 
-@app.post("/generate-video")
-async def generate_video(request: Request):
-    try:
-        client_ip = request.client.host
-        data = await request.json()
-        is_recreate = data.get("isRecreate", False)
-        
-        if not is_recreate and not can_generate_video(client_ip):
-            raise HTTPException(
-                status_code=429,
-                detail="Daily video generation limit reached. You can still recreate existing videos."
-            )
-            
-        scenes = data.get("scenes", [])
-        orientation = data.get("orientation", "horizontal")
-        
-        if not scenes:
-            raise HTTPException(status_code=400, detail="No scenes provided")
-            
-        logger.info(f"Starting video generation with {len(scenes)} scenes")
-        logger.info(f"Video orientation: {orientation}")
-        
-        # Get video dimensions based on orientation
-        video_config = VIDEO_ORIENTATIONS[orientation]
-        width = video_config["width"]
-        height = video_config["height"]
-        
-        # Process scenes and generate final video
-        output_video = process_scenes(scenes, orientation)
-        
-        if not os.path.exists(output_video):
-            raise HTTPException(status_code=500, detail="Failed to generate video")
-            
-        # Calculate total duration safely
-        total_duration = 0
-        for scene in scenes:
-            try:
-                if isinstance(scene, dict) and 'time' in scene:
-                    time_parts = scene['time'].split('-')
-                    if len(time_parts) == 2:
-                        start = extract_seconds(time_parts[0])
-                        end = extract_seconds(time_parts[1])
-                        total_duration += (end - start)
-                    else:
-                        total_duration += 5  # Default duration if time format is invalid
-                else:
-                    total_duration += 5  # Default duration if time is missing
-            except (ValueError, IndexError):
-                total_duration += 5  # Default duration if parsing fails
-        
-        # Prepare response with video details
-        video_details = {
-            "resolution": f"{width}x{height}",
-            "quality": "High",
-            "scenes": len(scenes),
-            "hasCaptions": any(scene.get("voiceover") for scene in scenes),
-            "duration": total_duration,
-            "orientation": orientation
-        }
-        
-        logger.info("Video generation completed successfully")
-        logger.info(f"Video details: {video_details}")
-        
-        # Track generation if not a recreation
-        if not is_recreate:
-            video_generations[client_ip].append(datetime.datetime.now())
-        
-        # Fix the video URL to include the full server URL
-        video_filename = os.path.basename(output_video)
-        return {
-            "videoUrl": f"http://localhost:8000/static/videos/{video_filename}",
-            "details": video_details,
-            "remainingGenerations": MAX_GENERATIONS_PER_IP - len(video_generations[client_ip])
-        }
-        
-    except Exception as e:
-        logger.error(f"Error generating video: {str(e)}", exc_info=True)
-        raise HTTPException(status_code=500, detail=str(e))
+class InMemoryRateLimiter:
+    """Fixed-window counters for a single process"""
+    
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.lock = threading.Lock()
+        self.window_start = current_window_start(window_seconds)
+        self.counts = {}
+    
+    def init(self):
+        pass
+    
+    def _roll_window(self):
+        # Every key shares the same window, so expiry is dropping the whole dict
+        window_start = current_window_start(self.window_seconds)
+        if window_start != self.window_start:
+            self.window_start = window_start
+            self.counts = {}
+    
+    def remaining(self, key: str, limit: int) -> int:
+        with self.lock:
+            self._roll_window()
+            return max(0, limit - self.counts.get(key, 0))
+    
+    def acquire(self, key: str, limit: int):
+        """Consume one unit if under the limit; returns (allowed, remaining, window_start)"""
+        with self.lock:
+            self._roll_window()
+            count = self.counts.get(key, 0)
+            if count >= limit:
+                return False, 0, self.window_start
+            self.counts[key] = count + 1
+            return True, limit - count - 1, self.window_start
+    
+    def release(self, key: str, window_start: int):
+        """Give back a unit whose request failed after acquiring it, unless its window has ended"""
+        with self.lock:
+            self._roll_window()
+            if window_start == self.window_start and self.counts.get(key, 0) > 0:
+                self.counts[key] -= 1
 
-def process_scenes(scenes, orientation):
-    """Process scenes and generate final video"""
-    import shutil
+class SQLiteRateLimiter:
+    """Fixed-window counters in the shared database, safe across worker processes"""
     
-    try:
-        # Create directories
-        videos_dir = Path("static/videos")
-        temp_dir = videos_dir / "temp"
-        videos_dir.mkdir(exist_ok=True)
-        temp_dir.mkdir(exist_ok=True)
+    def __init__(self, window_seconds: int):
+        self.window_seconds = window_seconds
+        self.purged_window = None
+    
+    def init(self):
+        get_db().execute("""
+            CREATE TABLE IF NOT EXISTS rate_limits (
+                key TEXT PRIMARY KEY,
+                window_start INTEGER NOT NULL,
+                count INTEGER NOT NULL
+            )
+        """)
+    
+    def _count(self, conn, key: str, window_start: int) -> int:
+        row = conn.execute("SELECT window_start, count FROM rate_limits WHERE key = ?", (key,)).fetchone()
+        if row is None or row["window_start"] != window_start:
+            return 0
+        return row["count"]
+    
+    def _purge(self, conn, window_start: int):
+        # Expire counters from earlier windows once per window per process
+        if self.purged_window != window_start:
+            conn.execute("DELETE FROM rate_limits WHERE window_start < ?", (window_start,))
+            self.purged_window = window_start
+    
+    def remaining(self, key: str, limit: int) -> int:
+        window_start = current_window_start(self.window_seconds)
+        return max(0, limit - self._count(get_db(), key, window_start))
+    
+    def acquire(self, key: str, limit: int):
+        """Consume one unit if under the limit; returns (allowed, remaining, window_start)"""
+        window_start = current_window_start(self.window_seconds)
+        with db_transaction() as conn:
+            self._purge(conn, window_start)
+            count = self._count(conn, key, window_start)
+            if count >= limit:
+                return False, 0, window_start
+            conn.execute(
+                "INSERT OR REPLACE INTO rate_limits (key, window_start, count) VALUES (?, ?, ?)",
+                (key, window_start, count + 1)
+            )
+        return True, limit - count - 1, window_start
+    
+    def release(self, key: str, window_start: int):
+        """Give back a unit whose request failed after acquiring it, unless its window has ended"""
+        if window_start != current_window_start(self.window_seconds):
+            return
+        get_db().execute(
+            "UPDATE rate_limits SET count = count - 1 WHERE key = ? AND window_start = ? AND count > 0",
+            (key, window_start)
+        )
+
+RATE_LIMITER_BACKENDS = {
+    "memory": InMemoryRateLimiter,
+    "sqlite": SQLiteRateLimiter
+}
+rate_limiter = RATE_LIMITER_BACKENDS[RATE_LIMIT_BACKEND](RATE_LIMIT_WINDOW_SECONDS)
+
+def resolve_rate_limit(request: Request) -> tuple:
+    """Return the (key, limit) a video generation request is counted against"""
+    api_key = request.headers.get("X-API-Key")
+    tier = RATE_LIMIT_API_KEYS.get(api_key) if api_key else None
+    if tier in RATE_LIMIT_TIERS:
+        return f"key:{api_key}", RATE_LIMIT_TIERS[tier]
+    return f"ip:{request.client.host}", RATE_LIMIT_TIERS["free"]
+
+def resolve_quality_profile(quality) -> str:
+    """Map a requested quality name onto a QUALITY_PROFILES key"""
+    name = (quality or VIDEO_QUALITY).lower()
+    name = QUALITY_ALIASES.get(name, name)
+    if name not in QUALITY_PROFILES:
+        raise ValueError(f"Unknown quality profile: {quality}")
+    return name
+
+def resolve_render_targets(data: dict) -> list:
+    """Renditions requested by /generate-video: targets, or the single orientation and quality"""
+    targets = data.get("targets")
+    if targets is None:
+        targets = [{"orientation": data.get("orientation", "horizontal")}]
+    if not isinstance(targets, list) or not targets:
+        raise ValueError("targets must be a non-empty list")
+    if len(targets) > MAX_RENDER_TARGETS:
+        raise ValueError(f"At most {MAX_RENDER_TARGETS} targets can be rendered per video")
+    
+    resolved = []
+    for target in targets:
+        if not isinstance(target, dict):
+            raise ValueError("Each target needs an orientation and a quality")
+        orientation = target.get("orientation", "horizontal")
+        if orientation not in VIDEO_ORIENTATIONS:
+            raise ValueError(f"Unknown orientation: {orientation}")
+        rendition = {
+            "orientation": orientation,
+            "quality": resolve_quality_profile(target.get("quality") or data.get("quality"))
+        }
+        if rendition not in resolved:
+            resolved.append(rendition)
+    return resolved
+
+def resolve_render_options(data: dict, scene_count: int, target_count: int = 1) -> tuple:
+    """Validate renderEngine, transitionSeconds and progressive; returns (engine, transition, progressive)"""
+    progressive = data.get("progressive", PROGRESSIVE_OUTPUT)
+    if not isinstance(progressive, bool):
+        raise ValueError("progressive must be true or false")
+    engine = data.get("renderEngine")
+    if not engine:
+        # One timeline pass decodes the audio once for every rendition; progressive
+        # output needs scenes that finish one by one
+        multi_pass = target_count > 1 and scene_count <= TIMELINE_MAX_SCENES and not progressive
+        engine = "timeline" if multi_pass else RENDER_ENGINE
+    if engine not in RENDER_ENGINES:
+        raise ValueError(f"Unknown render engine: {engine}")
+    try:
+        transition_seconds = float(data.get("transitionSeconds") or 0)
+    except (TypeError, ValueError):
+        raise ValueError("transitionSeconds must be a number")
+    if not 0 <= transition_seconds <= MAX_TRANSITION_SECONDS:
+        raise ValueError(f"transitionSeconds must be between 0 and {MAX_TRANSITION_SECONDS:g}")
+    if transition_seconds and engine != "timeline":
+        raise ValueError("Transitions require the timeline render engine")
+    if engine == "timeline" and scene_count > TIMELINE_MAX_SCENES:
+        raise ValueError(f"The timeline engine renders at most {TIMELINE_MAX_SCENES} scenes")
+    if progressive and engine != "segments":
+        raise ValueError("Progressive output requires the segments render engine")
+    return engine, transition_seconds, progressive
+
+def scale_caption_settings(orientation: str, scale: float) -> dict:
+    """CAPTION_SETTINGS for an orientation, with pixel sizes scaled to the output resolution"""
+    caption_config = dict(CAPTION_SETTINGS[orientation])
+    if scale == 1:
+        return caption_config
+    for key in ("font_size", "line_spacing", "box_padding", "border_width", "bottom_margin"):
+        caption_config[key] = max(1, round(caption_config[key] * scale))
+    return caption_config
+
+def build_render_config(orientation: str, quality=None) -> dict:
+    """Resolve output size, encoder and caption settings for one render"""
+    quality = resolve_quality_profile(quality)
+    profile = QUALITY_PROFILES[quality]
+    video_config = VIDEO_ORIENTATIONS[orientation]
+    scale = profile["short_side"] / min(video_config["width"], video_config["height"])
+    
+    return {
+        "orientation": orientation,
+        "quality": quality,
+        # libx264 with yuv420p needs even dimensions
+        "width": int(video_config["width"] * scale) // 2 * 2,
+        "height": int(video_config["height"] * scale) // 2 * 2,
+        "encoder": {
+            **SCENE_ENCODER_SETTINGS,
+            "preset": profile["preset"],
+            "crf": profile["crf"],
+            "fps": profile["fps"],
+            "audio_bitrate": profile["audio_bitrate"]
+        },
+        "captions": scale_caption_settings(orientation, scale)
+    }
+
+def build_caption_filter(voiceover: str, caption_config: dict) -> str:
+    """Build the drawtext filter used to burn a scene caption into the video"""
+    # Format and escape caption text
+    formatted_caption = format_caption_text(voiceover)
+    
+    return (
+        f"drawtext=fontfile={FONT_PATH}:"
+        f"text='{formatted_caption}':"
+        f"fontcolor={caption_config['font_color']}:"
+        f"fontsize={caption_config['font_size']}:"
+        f"line_spacing={caption_config['line_spacing']}:"
+        f"x=(w-text_w)/2:"  # Center horizontally
+        f"y=(h-text_h-{caption_config['bottom_margin']}):"  # Position from bottom
+        f"box=1:"
+        f"boxcolor=black@{caption_config['box_opacity']}:"
+        f"boxborderw={caption_config['box_padding']}:"
+        f"bordercolor={caption_config['border_color']}:"
+        f"borderw={caption_config['border_width']}:"
+        f"fix_bounds=true:"
+        f"shadowcolor=black@0.7:"  # Add shadow for better readability
+        f"shadowx=2:"
+        f"shadowy=2:"
+        f"expansion=normal"
+    )
+
+def video_encoder_args(encoder: dict, threads: int = 0, gop_seconds=None) -> list:
+    """x264 output options for a scene segment"""
+    args = [
+        '-c:v', encoder["video_codec"],
+        '-preset', encoder["preset"],
+        '-crf', str(encoder["crf"]),
+        '-threads', str(threads),  # 0 lets x264 pick based on available cores
+        '-pix_fmt', encoder["pix_fmt"],
+        '-r', str(encoder["fps"]),
+        '-video_track_timescale', str(encoder["video_timescale"])
+    ]
+    if encoder["still_mode"] != "off":
+        gop_seconds = gop_seconds or encoder["gop_seconds"]
+        args += [
+            '-tune', 'stillimage',
+            '-g', str(int(encoder["fps"] * gop_seconds))
+        ]
+    return args
+
+def audio_encoder_args(encoder: dict) -> list:
+    """AAC output options shared by every scene segment"""
+    return [
+        '-c:a', encoder["audio_codec"],
+        '-b:a', encoder["audio_bitrate"],
+        '-ar', str(encoder["audio_sample_rate"]),
+        '-ac', str(encoder["audio_channels"])
+    ]
+
+def still_video_filter(video_filter: str, duration, encoder: dict) -> str:
+    """Filtergraph for a looped still: process it at the source rate, then convert to the output fps"""
+    if encoder["still_mode"] == "off":
+        return f'[0:v]{video_filter}[v]'
+    # Captions are drawn at the low source rate; fps duplicates the finished frames.
+    # -t drops the last partial source frame, so clone one frame's worth before trimming
+    return (
+        f'[0:v]{video_filter},tpad=stop_mode=clone:stop_duration={1 / encoder["source_fps"]:g},'
+        f'fps={encoder["fps"]},trim=duration={duration}[v]'
+    )
+
+def scene_audio_filter(duration) -> str:
+    """Pad or cut the voiceover to the scene so the segment's audio matches its video"""
+    return f'[1:a]apad,atrim=duration={duration}[a]'
+
+def build_scene_command(image_path, audio_path, duration, video_filter: str, output_path,
+                        encoder: dict, threads: int = 0) -> list:
+    """Build a single FFmpeg command that turns one image and one audio track into a scene"""
+    cmd = ['ffmpeg', '-y']
+    if encoder["still_mode"] != "off":
+        cmd += ['-framerate', str(encoder["source_fps"])]
+    cmd += [
+        '-loop', '1',
+        '-t', str(duration),
+        '-i', str(image_path),
+        '-i', str(audio_path),
+        '-filter_complex',
+        f'{still_video_filter(video_filter, duration, encoder)};{scene_audio_filter(duration)}',
+        '-map', '[v]',
+        '-map', '[a]'
+    ]
+    return cmd + video_encoder_args(encoder, threads) + audio_encoder_args(encoder) + [str(output_path)]
+
+def build_still_clip_commands(image_path, audio_path, duration, video_filter: str, output_path,
+                              encoder: dict, threads: int = 0) -> list:
+    """Commands for repeat mode: encode one short GOP, then loop it to the duration while muxing audio"""
+    clip_path = Path(output_path).with_suffix(".gop.mp4")
+    clip_duration = min(duration, encoder["repeat_seconds"])
+    clip_cmd = [
+        'ffmpeg', '-y',
+        '-framerate', str(encoder["source_fps"]),
+        '-loop', '1',
+        '-t', str(clip_duration),
+        '-i', str(image_path),
+        '-filter_complex', still_video_filter(video_filter, clip_duration, encoder),
+        '-map', '[v]'
+    ] + video_encoder_args(encoder, threads, gop_seconds=clip_duration) + [str(clip_path)]
+    
+    repeat_cmd = [
+        'ffmpeg', '-y',
+        '-stream_loop', '-1',
+        '-t', str(duration),
+        '-i', str(clip_path),
+        '-i', str(audio_path),
+        '-filter_complex', scene_audio_filter(duration),
+        '-map', '0:v',
+        '-map', '[a]',
+        '-c:v', 'copy',
+        '-video_track_timescale', str(encoder["video_timescale"])
+    ] + audio_encoder_args(encoder) + [str(output_path)]
+    return [clip_cmd, repeat_cmd]
+
+def encode_scene(image_path, audio_path, duration, video_filter: str, output_path,
+                 encoder: dict, threads: int = 0, cancel_event=None, on_progress=None):
+    """Run the FFmpeg command(s) for one scene segment
+    
+    on_progress(percent, speed) follows the command that writes the segment.
+    """
+    if encoder["still_mode"] == "repeat":
+        commands = build_still_clip_commands(
+            image_path, audio_path, duration, video_filter, output_path, encoder, threads
+        )
+    else:
+        commands = [build_scene_command(
+            image_path, audio_path, duration, video_filter, output_path, encoder, threads
+        )]
+    try:
+        with RENDER_STAGE_SECONDS.time(stage="scene_encode"):
+            for index, cmd in enumerate(commands, 1):
+                run_ffmpeg(
+                    cmd, duration, cancel_event,
+                    on_progress if index == len(commands) else None
+                )
+    finally:
+        Path(output_path).with_suffix(".gop.mp4").unlink(missing_ok=True)
+
+def render_scene_segment(scene_index, image_path, audio_path, duration, base_filter: str,
+                         caption_filter, output_path, encoder: dict, threads: int = 0,
+                         cancel_event=None, on_progress=None):
+    """Render a scene with a single video encode, falling back to no captions on failure
+    
+    Returns False if captions were requested but had to be dropped.
+    """
+    if caption_filter:
+        logger.info(f"Scene {scene_index}: Rendering with captions")
+        try:
+            encode_scene(
+                image_path, audio_path, duration, f"{base_filter},{caption_filter}", output_path,
+                encoder, threads, cancel_event, on_progress
+            )
+            logger.info(f"Scene {scene_index}: Rendered successfully with captions")
+            return True
+        except FFmpegTimeout:
+            # A hung encode isn't a caption problem; retrying would wait out a second timeout
+            raise
+        except subprocess.CalledProcessError as e:
+            FFMPEG_FAILURES_TOTAL.inc(stage="scene_captions")
+            CAPTION_FALLBACKS_TOTAL.inc(to="none")
+            log_ffmpeg_error(e, f"scene {scene_index} caption addition")
+            logger.warning(f"Scene {scene_index}: Falling back to video without captions")
+    else:
+        logger.info(f"Scene {scene_index}: No captions to add")
+    
+    try:
+        encode_scene(
+            image_path, audio_path, duration, base_filter, output_path, encoder, threads,
+            cancel_event, on_progress
+        )
+        logger.info(f"Scene {scene_index}: Rendered successfully")
+    except subprocess.CalledProcessError as e:
+        FFMPEG_FAILURES_TOTAL.inc(stage="scene")
+        log_ffmpeg_error(e, f"scene {scene_index} rendering")
+        raise
+    return not caption_filter
+
+_file_hashes = {}
+_file_hashes_lock = threading.Lock()
+
+def file_sha256(path) -> str:
+    """Hash a file's contents, memoized by path, size and modification time"""
+    stat = os.stat(path)
+    memo_key = (str(Path(path).resolve()), stat.st_size, stat.st_mtime_ns)
+    with _file_hashes_lock:
+        if memo_key in _file_hashes:
+            return _file_hashes[memo_key]
+    
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    
+    with _file_hashes_lock:
+        _file_hashes[memo_key] = digest.hexdigest()
+    return digest.hexdigest()
+
+def segment_cache_key(image_path, audio_path, caption: str, render_config: dict, duration) -> str:
+    """Content address of a scene segment: everything that affects its encoded output"""
+    key_data = {
+        "version": SEGMENT_CACHE_VERSION,
+        "image": file_sha256(image_path),
+        "audio": file_sha256(audio_path),
+        "caption": caption or "",
+        "orientation": render_config["orientation"],
+        "size": [render_config["width"], render_config["height"]],
+        "caption_settings": render_config["captions"],
+        "font": FONT_FILE,
+        "caption_renderer": CAPTION_RENDERER,
+        "encoder": render_config["encoder"],
+        "duration": duration
+    }
+    return hashlib.sha256(json.dumps(key_data, sort_keys=True).encode()).hexdigest()
+
+class SegmentCache:
+    """Content-addressed store of rendered scene segments with size-bounded LRU eviction"""
+    
+    def __init__(self, directory: Path, max_bytes: int):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.lock = threading.Lock()
+        self.pinned = defaultdict(int)  # Segments referenced by renders in progress
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def init(self):
+        self.directory.mkdir(parents=True, exist_ok=True)
+        get_db().execute("""
+            CREATE TABLE IF NOT EXISTS segment_cache (
+                key TEXT PRIMARY KEY,
+                path TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created_at REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        get_db().execute("CREATE INDEX IF NOT EXISTS idx_segment_cache_lru ON segment_cache (last_used)")
+    
+    def lookup(self, key: str):
+        """Return the cached segment for key and pin it, or None on a miss"""
+        conn = get_db()
+        with self.lock:
+            row = conn.execute("SELECT path FROM segment_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and Path(row["path"]).exists():
+                conn.execute("UPDATE segment_cache SET last_used = ? WHERE key = ?", (time.time(), key))
+                self.pinned[key] += 1
+                self.hits += 1
+                SEGMENT_CACHE_REQUESTS_TOTAL.inc(result="hit")
+                return Path(row["path"])
+            if row is not None:
+                conn.execute("DELETE FROM segment_cache WHERE key = ?", (key,))
+            self.misses += 1
+            SEGMENT_CACHE_REQUESTS_TOTAL.inc(result="miss")
+            return None
+    
+    def store(self, key: str, segment_path: Path) -> Path:
+        """Move a freshly rendered segment into the cache and return its pinned cached path
         
-        logger.info("Created temporary directories for video processing")
+        When another render already stored the same key, its segment is kept and this one dropped.
+        """
+        cached_path = self.directory / f"{key}.mp4"
+        # From a scratch root on another filesystem the move is a copy, so never write
+        # straight over a cached segment another render may be reading
+        partial_path = self.directory / f"{key}.{uuid.uuid4().hex}.tmp"
+        shutil.move(str(segment_path), str(partial_path))
+        now = time.time()
+        with self.lock:
+            conn = get_db()
+            row = conn.execute("SELECT path FROM segment_cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and Path(row["path"]).exists():
+                partial_path.unlink(missing_ok=True)
+                conn.execute("UPDATE segment_cache SET last_used = ? WHERE key = ?", (now, key))
+            else:
+                os.replace(partial_path, cached_path)
+                conn.execute(
+                    "INSERT OR REPLACE INTO segment_cache (key, path, size, created_at, last_used) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (key, str(cached_path), cached_path.stat().st_size, now, now)
+                )
+            self.pinned[key] += 1
+            self._evict()
+        return cached_path
+    
+    def release(self, segment_path: Path):
+        """Unpin a segment once the render that used it has finished"""
+        if segment_path.parent != self.directory:
+            return
+        with self.lock:
+            key = segment_path.stem
+            self.pinned[key] -= 1
+            if self.pinned[key] <= 0:
+                del self.pinned[key]
+    
+    def _evict(self):
+        conn = get_db()
+        total = conn.execute("SELECT COALESCE(SUM(size), 0) FROM segment_cache").fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        for row in conn.execute("SELECT key, path, size FROM segment_cache ORDER BY last_used").fetchall():
+            if total <= self.max_bytes:
+                break
+            if row["key"] in self.pinned:
+                continue
+            Path(row["path"]).unlink(missing_ok=True)
+            conn.execute("DELETE FROM segment_cache WHERE key = ?", (row["key"],))
+            total -= row["size"]
+            self.evictions += 1
+    
+    def stats(self) -> dict:
+        row = get_db().execute(
+            "SELECT COUNT(*) AS entries, COALESCE(SUM(size), 0) AS size FROM segment_cache"
+        ).fetchone()
+        with self.lock:
+            return {
+                "entries": row["entries"],
+                "sizeBytes": row["size"],
+                "maxBytes": self.max_bytes,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions
+            }
+
+segment_cache = SegmentCache(SEGMENT_CACHE_DIR, SEGMENT_CACHE_MAX_BYTES)
+
+class RenderCancelled(Exception):
+    """Raised inside the render pipeline when its job has been cancelled"""
+
+def init_job_store():
+    """Create the render job table if it doesn't exist"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS render_jobs (
+            id TEXT PRIMARY KEY,
+            status TEXT NOT NULL,
+            client_ip TEXT,
+            request TEXT NOT NULL,
+            progress TEXT,
+            result TEXT,
+            error TEXT,
+            owner_pid INTEGER,
+            cancel_requested INTEGER NOT NULL DEFAULT 0,
+            limit_key TEXT,
+            limit_window INTEGER,
+            created_at REAL NOT NULL,
+            updated_at REAL NOT NULL
+        )
+    """)
+    get_db().execute("CREATE INDEX IF NOT EXISTS idx_render_jobs_status ON render_jobs (status, created_at)")
+
+def create_render_job(request_data: dict, client_ip: str, job_id: str = None, limit_key: str = None,
+                      limit_window: int = None) -> str:
+    """Store a new queued render job and return its id
+    
+    limit_key is the rate limit key charged for the job in the window starting at
+    limit_window; the unit is given back if the job fails or is cancelled.
+    """
+    job_id = job_id or uuid.uuid4().hex
+    now = time.time()
+    # The job holds its input assets until it finishes so eviction can't remove them
+    inputs = [
+        scene[key] for scene in request_data.get("scenes", [])
+        if isinstance(scene, dict) for key in ("imageUrl", "audioUrl") if scene.get(key)
+    ]
+    with db_transaction() as conn:
+        conn.execute(
+            "INSERT INTO render_jobs (id, status, client_ip, request, limit_key, limit_window, created_at, updated_at) "
+            "VALUES (?, 'queued', ?, ?, ?, ?, ?, ?)",
+            (job_id, client_ip, json.dumps(request_data), limit_key, limit_window, now, now)
+        )
+        storage_manager.add_references(conn, "job", job_id, inputs)
+    return job_id
+
+def release_job_limit(job_id: str):
+    """Give back the daily-limit unit charged for a job that didn't produce a video, at most once"""
+    conn = get_db()
+    row = conn.execute("SELECT limit_key, limit_window FROM render_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None or row["limit_key"] is None:
+        return
+    cursor = conn.execute(
+        "UPDATE render_jobs SET limit_key = NULL WHERE id = ? AND limit_key = ?", (job_id, row["limit_key"])
+    )
+    if cursor.rowcount == 1:
+        rate_limiter.release(row["limit_key"], row["limit_window"])
+
+def update_render_job(job_id: str, **fields):
+    """Update columns of a render job; dict values are stored as JSON"""
+    columns = []
+    values = []
+    for name, value in fields.items():
+        columns.append(f"{name} = ?")
+        values.append(json.dumps(value) if isinstance(value, dict) else value)
+    columns.append("updated_at = ?")
+    values.extend([time.time(), job_id])
+    get_db().execute(f"UPDATE render_jobs SET {', '.join(columns)} WHERE id = ?", values)
+
+def get_render_job(job_id: str):
+    """Load a render job as a dict, or None if it doesn't exist"""
+    row = get_db().execute("SELECT * FROM render_jobs WHERE id = ?", (job_id,)).fetchone()
+    if row is None:
+        return None
+    job = dict(row)
+    for column in ("request", "progress", "result"):
+        job[column] = json.loads(job[column]) if job[column] else None
+    return job
+
+class JobProgress:
+    """Per-scene progress of a render job, persisted to the job store on every change"""
+    
+    def __init__(self, job_id: str, scene_count: int, passes: int = 1):
+        self.job_id = job_id
+        self.lock = threading.Lock()
+        self.last_saved = 0.0
+        self.state = {
+            "stage": "queued",
+            "totalPasses": passes,  # Renditions rendered one after another by the segment engine
+            "completedPasses": 0,
+            "totalScenes": scene_count,
+            "completedScenes": 0,
+            "percent": 0.0,
+            "scenes": {str(i): "pending" for i in range(1, scene_count + 1)},
+            "encoding": {},  # Live FFmpeg percent and speed of scenes being encoded
+            "streamedScenes": 0  # Scenes playable from the progressive playlist
+        }
+    
+    def stage(self, name: str):
+        with self.lock:
+            self.state["stage"] = name
+            self._save()
+    
+    def scene(self, index: int, status: str):
+        with self.lock:
+            self.state["scenes"][str(index)] = status
+            self.state["completedScenes"] = sum(
+                1 for value in self.state["scenes"].values() if value == "completed"
+            )
+            if status != "rendering":
+                self.state["encoding"].pop(str(index), None)
+            self._save()
+    
+    def streamed(self, count: int):
+        with self.lock:
+            self.state["streamedScenes"] = count
+            self._save()
+    
+    def next_pass(self):
+        """Start the scenes over for the next rendition"""
+        with self.lock:
+            self.state["completedPasses"] += 1
+            self.state["scenes"] = {index: "pending" for index in self.state["scenes"]}
+            self.state["completedScenes"] = 0
+            self.state["encoding"] = {}
+            self._save()
+    
+    def encoding(self, index: int, percent, speed):
+        """Record FFmpeg progress for a scene; written at most once per PROGRESS_SAVE_INTERVAL_SECONDS"""
+        with self.lock:
+            self.state["encoding"][str(index)] = {
+                "percent": None if percent is None else round(percent, 1),
+                "speed": speed
+            }
+            if time.monotonic() - self.last_saved >= PROGRESS_SAVE_INTERVAL_SECONDS:
+                self._save()
+    
+    def _save(self):
+        # Completed scenes plus the encoded share of the ones in flight
+        partial = sum((scene["percent"] or 0) / 100 for scene in self.state["encoding"].values())
+        total = self.state["totalScenes"] or 1
+        done = self.state["completedPasses"] + (self.state["completedScenes"] + partial) / total
+        self.state["percent"] = round(min(100.0, done / self.state["totalPasses"] * 100), 1)
+        self.last_saved = time.monotonic()
+        update_render_job(self.job_id, progress=self.state)
+
+class JobCancellation:
+    """Cancel flag of a render job, kept in its row so a request to any worker process reaches it
+    
+    Used like a threading.Event by the render pipeline; is_set() re-reads
+    the job at most every CANCEL_POLL_INTERVAL_SECONDS.
+    """
+    
+    def __init__(self, job_id: str):
+        self.job_id = job_id
+        self.event = threading.Event()
+        self.last_checked = 0.0
+    
+    def set(self):
+        self.event.set()
+    
+    def is_set(self) -> bool:
+        if self.event.is_set():
+            return True
+        if time.monotonic() - self.last_checked >= CANCEL_POLL_INTERVAL_SECONDS:
+            self.last_checked = time.monotonic()
+            row = get_db().execute(
+                "SELECT cancel_requested FROM render_jobs WHERE id = ?", (self.job_id,)
+            ).fetchone()
+            if row is None or row["cancel_requested"]:
+                self.event.set()
+        return self.event.is_set()
+
+render_executor = ThreadPoolExecutor(max_workers=RENDER_JOB_WORKERS, thread_name_prefix="render-job")
+render_futures = {}
+render_cancel_events = {}
+
+def submit_render_job(job_id: str):
+    """Hand a queued job to the background render executor"""
+    render_cancel_events[job_id] = JobCancellation(job_id)
+    render_futures[job_id] = render_executor.submit(run_render_job, job_id)
+
+def claim_render_job(job_id: str) -> bool:
+    """Atomically take a queued job for this process; False if another worker got it first"""
+    cursor = get_db().execute(
+        "UPDATE render_jobs SET status = 'running', owner_pid = ?, updated_at = ? "
+        "WHERE id = ? AND status = 'queued' AND cancel_requested = 0",
+        (os.getpid(), time.time(), job_id)
+    )
+    return cursor.rowcount == 1
+
+def run_render_job(job_id: str):
+    """Render a queued job in the background and record its outcome"""
+    cancel_event = render_cancel_events.get(job_id) or JobCancellation(job_id)
+    # Every worker process resubmits queued jobs on startup; only one may run each
+    if not claim_render_job(job_id):
+        render_futures.pop(job_id, None)
+        render_cancel_events.pop(job_id, None)
+        return
+    started = None
+    outcome = "failed"
+    playlist = None
+    try:
+        job = get_render_job(job_id)
         
-        # Generate unique video filename
-        video_id = uuid.uuid4()
-        timestamp = int(time.time())
-        video_filename = f"video_{timestamp}_{video_id}_{orientation}.mp4"
-        video_path = videos_dir / video_filename
+        scenes = job["request"]["scenes"]
+        orientation = job["request"]["orientation"]
+        quality = job["request"].get("quality")
+        targets = job["request"].get("targets") or [{"orientation": orientation, "quality": quality}]
+        engine = job["request"].get("renderEngine") or RENDER_ENGINE
+        transition_seconds = job["request"].get("transitionSeconds", 0)
+        progress = JobProgress(job_id, len(scenes), 1 if engine == "timeline" else len(targets))
+        playlist_url = job["request"].get("playlistUrl")
+        started = time.perf_counter()
+        RENDER_JOBS_IN_FLIGHT.inc()
+        progress.stage("rendering")
         
-        # Get video dimensions
-        video_config = VIDEO_ORIENTATIONS[orientation]
-        VIDEO_WIDTH = video_config["width"]
-        VIDEO_HEIGHT = video_config["height"]
+        # Probe every asset once; the render and the response share these timings
+        with RENDER_STAGE_SECONDS.time(stage="plan"):
+            scene_plans = plan_scenes(scenes)
+        if playlist_url:
+            playlist = ProgressivePlaylist(STREAMS_DIR / job_id, scene_plans, progress)
+        output_videos = process_renditions(
+            scenes, targets, progress=progress, cancel_event=cancel_event,
+            scene_plans=scene_plans, job_id=job_id, engine=engine, transition_seconds=transition_seconds,
+            playlist=playlist
+        )
         
-        scene_videos = []
+        if not all(os.path.exists(video) for video in output_videos):
+            raise Exception("Failed to generate video")
         
-        # Process each scene
-        for i, scene in enumerate(scenes, 1):
-            logger.info(f"Processing scene {i}/{len(scenes)}")
+        renditions = []
+        for target, output_video in zip(targets, output_videos):
+            render_config = build_render_config(target["orientation"], target["quality"])
+            previews, previews_size = None, 0
             try:
-                # Validate required scene properties
-                if not isinstance(scene, dict):
-                    raise ValueError(f"Scene {i} is not a valid dictionary")
-                
-                if 'time' not in scene:
-                    logger.warning(f"Scene {i} missing time property, using default duration")
-                    scene['time'] = "0-5"  # Default 5 second duration
-                
-                # Get paths from scene data
-                image_url = scene.get('imageUrl', '')
-                audio_url = scene.get('audioUrl', '')
-                voiceover = scene.get('voiceover', '')
-                
-                if not image_url or not audio_url:
-                    raise ValueError(f"Scene {i} missing required image or audio URL")
-                
-                # Convert URLs to local paths
-                image_path = image_url.replace('http://localhost:8000', '')
-                audio_path = audio_url.replace('http://localhost:8000', '')
-                
-                # Convert to Path objects
-                local_image_path = Path(image_path.lstrip('/'))
-                local_audio_path = Path(audio_path.lstrip('/'))
-                
-                if not local_image_path.exists():
-                    raise Exception(f"Image file not found: {image_path}")
-                if not local_audio_path.exists():
-                    raise Exception(f"Audio file not found: {audio_path}")
-                
-                # Parse time safely
-                try:
-                    time_parts = scene['time'].split('-')
-                    start = extract_seconds(time_parts[0])
-                    end = extract_seconds(time_parts[1])
-                    duration = end - start
-                    if duration <= 0:
-                        logger.warning(f"Scene {i} has invalid duration, using default")
-                        duration = 5
-                except (IndexError, ValueError) as e:
-                    logger.warning(f"Scene {i} has invalid time format, using default duration: {e}")
-                    duration = 5
-                
-                # Get image dimensions
-                img_width, img_height = get_image_dimensions(local_image_path)
-                
-                # Calculate scaling and padding with improved logic
-                target_ratio = VIDEO_WIDTH / VIDEO_HEIGHT
-                img_ratio = img_width / img_height
-                
-                if orientation == "horizontal":
-                    # For horizontal videos (16:9)
-                    if img_ratio > target_ratio:
-                        # Image is wider than target ratio
-                        scale_width = VIDEO_WIDTH
-                        scale_height = int(VIDEO_WIDTH / img_ratio)
-                        pad_x = 0
-                        pad_y = (VIDEO_HEIGHT - scale_height) // 2
-                    else:
-                        # Image is taller than target ratio
-                        scale_height = VIDEO_HEIGHT
-                        scale_width = int(VIDEO_HEIGHT * img_ratio)
-                        pad_x = (VIDEO_WIDTH - scale_width) // 2
-                        pad_y = 0
-                else:
-                    # For vertical videos (9:16)
-                    target_height = VIDEO_HEIGHT
-                    target_width = VIDEO_WIDTH
-                    
-                    # Calculate dimensions to fit within target while maintaining aspect ratio
-                    if img_ratio > (target_width / target_height):
-                        # Image is relatively wider
-                        scale_width = target_width
-                        scale_height = int(target_width / img_ratio)
-                        pad_x = 0
-                        pad_y = (target_height - scale_height) // 2
-                    else:
-                        # Image is relatively taller
-                        scale_height = target_height
-                        scale_width = int(target_height * img_ratio)
-                        pad_x = (target_width - scale_width) // 2
-                        pad_y = 0
-                
-                # Create video from image
-                scene_video = temp_dir / f"scene_{i}.mp4"
-                
-                # Update the FFmpeg command for better quality
-                img_cmd = [
-                    'ffmpeg', '-y',
-                    '-loop', '1',
-                    '-i', str(local_image_path),
-                    '-c:v', 'libx264',
-                    '-t', str(duration),
-                    '-pix_fmt', 'yuv420p',
-                    '-vf', (
-                        f'scale={scale_width}:{scale_height}:force_original_aspect_ratio=decrease,'
-                        f'pad={VIDEO_WIDTH}:{VIDEO_HEIGHT}:{pad_x}:{pad_y}:color=black,'
-                        'format=yuv420p'
-                    ),
-                    '-preset', 'slow',
-                    '-crf', '18',  # Lower CRF for better quality (range 0-51, lower is better)
-                    str(scene_video)
-                ]
-                
-                logger.info(f"Scene {i}: Creating base video from image")
-                try:
-                    subprocess.run(img_cmd, check=True, capture_output=True)
-                    logger.info(f"Scene {i}: Base video created successfully")
-                except subprocess.CalledProcessError as e:
-                    log_ffmpeg_error(e, f"scene {i} image to video conversion")
-                    raise
-                
-                # Add audio to video
-                scene_with_audio = temp_dir / f"scene_{i}_with_audio.mp4"
-                audio_cmd = [
-                    'ffmpeg', '-y',
-                    '-i', str(scene_video),
-                    '-i', str(local_audio_path),
-                    '-c:v', 'copy',
-                    '-c:a', 'aac',
-                    '-b:a', '192k',
-                    str(scene_with_audio)
-                ]
-                
-                logger.info(f"Scene {i}: Adding audio")
+                with RENDER_STAGE_SECONDS.time(stage="previews"):
+                    previews = render_previews(scene_plans, render_config, output_video, transition_seconds)
+                previews_size = previews.pop("sizeBytes")
+            except Exception as e:
+                # The video is still usable without a poster or seek previews
+                logger.warning(f"Job {job_id}: could not render previews for {output_video}: {str(e)}")
+            # The video's size includes its previews, which are evicted along with it
+            storage_manager.register(output_video, "video", os.path.getsize(output_video) + previews_size)
+            renditions.append({**build_rendition(target, output_video), "previews": previews})
+        video_details = build_video_details(scene_plans, orientation, quality, engine, transition_seconds)
+        video_details["renditions"] = renditions
+        video_details["previews"] = renditions[0]["previews"]
+        logger.info(f"Job {job_id}: video generation completed successfully")
+        logger.info(f"Video details: {video_details}")
+        
+        if playlist is not None:
+            storage_manager.register(playlist.path, "stream", size=playlist.size())
+        
+        progress.stage("completed")
+        update_render_job(job_id, status="completed", result={
+            "videoUrl": renditions[0]["videoUrl"],
+            "playlistUrl": playlist_url if playlist is not None and playlist.finished else None,
+            "details": video_details
+        })
+        outcome = "completed"
+    except RenderCancelled:
+        logger.info(f"Job {job_id}: render cancelled")
+        update_render_job(job_id, status="cancelled")
+        outcome = "cancelled"
+    except Exception as e:
+        logger.error(f"Job {job_id}: error generating video: {str(e)}", exc_info=True)
+        update_render_job(job_id, status="failed", error=str(e))
+    finally:
+        if started is not None:
+            RENDER_JOBS_IN_FLIGHT.dec()
+            RENDER_JOBS_TOTAL.inc(status=outcome)
+            RENDER_JOB_SECONDS.observe(time.perf_counter() - started, status=outcome)
+        if outcome != "completed":
+            release_job_limit(job_id)
+            if playlist is not None:
+                playlist.remove()
+        storage_manager.release_references("job", job_id)
+        render_futures.pop(job_id, None)
+        render_cancel_events.pop(job_id, None)
+
+def resume_render_jobs():
+    """Requeue jobs whose worker process died mid-render, then submit every queued job"""
+    conn = get_db()
+    running = conn.execute("SELECT id, owner_pid FROM render_jobs WHERE status = 'running'").fetchall()
+    for row in running:
+        # Another live worker still owns it; a pid equal to ours was left by a previous run
+        if row["owner_pid"] is not None and row["owner_pid"] != os.getpid() and process_alive(row["owner_pid"]):
+            continue
+        conn.execute(
+            "UPDATE render_jobs SET status = 'queued', owner_pid = NULL "
+            "WHERE id = ? AND status = 'running' AND owner_pid IS ?",
+            (row["id"], row["owner_pid"])
+        )
+    rows = conn.execute(
+        "SELECT id FROM render_jobs WHERE status = 'queued' ORDER BY created_at"
+    ).fetchall()
+    for row in rows:
+        submit_render_job(row["id"])
+    if rows:
+        logger.info(f"Resumed {len(rows)} render jobs")
+
+def build_video_details(scene_plans, orientation: str, quality=None, engine=None,
+                        transition_seconds=0) -> dict:
+    """Describe a rendered video for the API response"""
+    render_config = build_render_config(orientation, quality)
+    engine = engine or RENDER_ENGINE
+    if engine != "timeline":
+        transition_seconds = 0
+    return {
+        "resolution": f"{render_config['width']}x{render_config['height']}",
+        "quality": QUALITY_PROFILES[render_config["quality"]]["label"],
+        "profile": render_config["quality"],
+        "scenes": len(scene_plans),
+        "hasCaptions": any(plan["voiceover"] for plan in scene_plans),
+        "duration": round(timeline_duration(scene_plans, transition_seconds), 2),
+        "sceneDurations": [plan["duration"] for plan in scene_plans],
+        "timing": SCENE_TIMING,
+        "renderEngine": engine,
+        "transitionSeconds": effective_transition(scene_plans, transition_seconds),
+        "orientation": orientation
+    }
+
+def build_rendition(target: dict, video_path) -> dict:
+    """Describe one output file of a render job"""
+    render_config = build_render_config(target["orientation"], target["quality"])
+    return {
+        "orientation": target["orientation"],
+        "profile": render_config["quality"],
+        "quality": QUALITY_PROFILES[render_config["quality"]]["label"],
+        "resolution": f"{render_config['width']}x{render_config['height']}",
+        "videoUrl": f"http://localhost:8000/static/videos/{os.path.basename(video_path)}",
+        "sizeBytes": os.path.getsize(video_path)
+    }
+
+@app.on_event("startup")
+async def start_maintenance():
+    await asyncio.to_thread(sweep_scratch_orphans)
+    app.state.maintenance_task = asyncio.create_task(run_periodic_maintenance())
+
+@app.on_event("shutdown")
+async def stop_maintenance():
+    app.state.maintenance_task.cancel()
+
+@app.on_event("startup")
+def init_local_state():
+    init_scene_store()
+    init_job_store()
+    init_probe_cache()
+    rate_limiter.init()
+    segment_cache.init()
+    generation_cache.init()
+    init_image_store()
+    storage_manager.init()
+    resume_render_jobs()
+
+@app.on_event("shutdown")
+def stop_render_jobs():
+    # Running jobs stay marked as running and are requeued on the next start
+    render_executor.shutdown(wait=False, cancel_futures=True)
+
+@app.post("/generate-video", status_code=202)
+async def generate_video(request: Request):
+    try:
+        client_ip = request.client.host
+        data = await request.json()
+        is_recreate = data.get("isRecreate", False)
+        
+        try:
+            targets = resolve_render_targets(data)
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        scenes = data.get("scenes", [])
+        # The first target is the primary video reported as videoUrl
+        orientation = targets[0]["orientation"]
+        quality = targets[0]["quality"]
+        
+        if not scenes:
+            raise HTTPException(status_code=400, detail="No scenes provided")
+        try:
+            engine, transition_seconds, progressive = resolve_render_options(data, len(scenes), len(targets))
+        except ValueError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+        
+        # Recreations and draft/preview renders don't use up the daily limit;
+        # all renditions of one video count as a single generation
+        counts_toward_limit = not is_recreate and any(
+            QUALITY_PROFILES[target["quality"]]["counts_toward_limit"] for target in targets
+        )
+        limit_key, limit = resolve_rate_limit(request)
+        if counts_toward_limit:
+            allowed, remaining, limit_window = rate_limiter.acquire(limit_key, limit)
+            if not allowed:
+                raise HTTPException(
+                    status_code=429,
+                    detail="Daily video generation limit reached. You can still recreate existing videos."
+                )
+        else:
+            remaining = rate_limiter.remaining(limit_key, limit)
+            limit_window = None
+        
+        # The playlist lives under the job id, so its URL is known before the job exists
+        job_id = uuid.uuid4().hex
+        playlist_url = f"http://localhost:8000/static/streams/{job_id}/playlist.m3u8" if progressive else None
+        try:
+            create_render_job(
+                {
+                    "scenes": scenes, "orientation": orientation, "quality": quality, "targets": targets,
+                    "renderEngine": engine, "transitionSeconds": transition_seconds,
+                    "playlistUrl": playlist_url
+                },
+                client_ip, job_id, limit_key if counts_toward_limit else None, limit_window
+            )
+        except Exception:
+            if counts_toward_limit:
+                rate_limiter.release(limit_key, limit_window)
+            raise
+        submit_render_job(job_id)
+        logger.info(
+            f"Queued render job {job_id} with {len(scenes)} scenes, "
+            f"{len(targets)} renditions ({orientation}, {quality}, {engine})"
+        )
+        
+        return {
+            "jobId": job_id,
+            "status": "queued",
+            "quality": quality,
+            "targets": targets,
+            "renderEngine": engine,
+            "playlistUrl": playlist_url,
+            "statusUrl": f"http://localhost:8000/jobs/{job_id}",
+            "remainingGenerations": remaining
+        }
+        
+    except HTTPException:
+        raise
+    except Exception as e:
+        logger.error(f"Error queueing video: {str(e)}", exc_info=True)
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/jobs/{job_id}")
+async def get_job_status(job_id: str):
+    job = get_render_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    
+    result = job["result"] or {}
+    # A progressive playlist is live while the job runs and kept only if it was completed
+    playlist_url = result.get("playlistUrl")
+    if job["status"] in ("queued", "running"):
+        playlist_url = job["request"].get("playlistUrl")
+    return {
+        "jobId": job["id"],
+        "status": job["status"],
+        "progress": job["progress"],
+        "videoUrl": result.get("videoUrl"),
+        "playlistUrl": playlist_url,
+        "details": result.get("details"),
+        "error": job["error"],
+        "createdAt": job["created_at"],
+        "updatedAt": job["updated_at"]
+    }
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {"segments": segment_cache.stats(), "generations": generation_cache.stats()}
+
+def refresh_disk_metrics():
+    """Update the disk gauges from the scratch root and the asset and segment indexes"""
+    scratch_bytes = 0
+    if SCRATCH_ROOT.exists():
+        for root, _, files in os.walk(SCRATCH_ROOT):
+            for name in files:
                 try:
-                    subprocess.run(audio_cmd, check=True, capture_output=True)
-                    logger.info(f"Scene {i}: Audio added successfully")
-                except subprocess.CalledProcessError as e:
-                    log_ffmpeg_error(e, f"scene {i} audio addition")
-                    raise
-                
-                # Add captions if voiceover exists
-                if voiceover:
-                    logger.info(f"Scene {i}: Adding captions")
-                    caption_video = temp_dir / f"scene_{i}_with_caption.mp4"
-                    
-                    # Format and escape caption text
-                    formatted_caption = format_caption_text(voiceover)
-                    
-                    # Get caption settings for current orientation
-                    caption_config = CAPTION_SETTINGS[orientation]
-                    
-                    # Create improved drawtext filter with better positioning and styling
-                    caption_filter = (
-                        f"drawtext=fontfile={FONT_PATH}:"
-                        f"text='{formatted_caption}':"
-                        f"fontcolor={caption_config['font_color']}:"
-                        f"fontsize={caption_config['font_size']}:"
-                        f"line_spacing={caption_config['line_spacing']}:"
-                        f"x=(w-text_w)/2:"  # Center horizontally
-                        f"y={caption_config['y_position']}:"  # Position from bottom
-                        f"box=1:"
-                        f"boxcolor=black@{caption_config['box_opacity']}:"
-                        f"boxborderw={caption_config['box_padding']}:"
-                        f"bordercolor={caption_config['border_color']}:"
-                        f"borderw={caption_config['border_width']}:"
-                        f"fix_bounds=true:"
-                        f"shadowcolor=black@0.7:"  # Add shadow for better readability
-                        f"shadowx=2:"
-                        f"shadowy=2:"
-                        f"expansion=normal"
-                    )
-                    
-                    try:
-                        drawtext_cmd = [
-                            'ffmpeg', '-y',
-                            '-i', str(scene_with_audio),
-                            '-vf', caption_filter,
-                            '-codec:a', 'copy',
-                            str(caption_video)
-                        ]
-                        
-                        subprocess.run(drawtext_cmd, check=True, capture_output=True)
-                        logger.info(f"Scene {i}: Captions added successfully")
-                        scene_videos.append(caption_video)
-                    except subprocess.CalledProcessError as e:
-                        log_ffmpeg_error(e, f"scene {i} caption addition")
-                        logger.warning(f"Scene {i}: Falling back to video without captions")
-                        scene_videos.append(scene_with_audio)
-                else:
-                    logger.info(f"Scene {i}: No captions to add")
-                    scene_videos.append(scene_with_audio)
-                
+                    scratch_bytes += os.path.getsize(os.path.join(root, name))
+                except OSError:
+                    pass  # Removed by a finishing render
+    SCRATCH_BYTES.set(scratch_bytes)
+    with scratch_lock:
+        SCRATCH_RESERVED_BYTES.set(sum(scratch_reservations.values()))
+    SCRATCH_FREE_BYTES.set(shutil.disk_usage(SCRATCH_ROOT if SCRATCH_ROOT.exists() else DATA_DIR).free)
+    for kind, usage in storage_manager.stats()["byKind"].items():
+        STORAGE_BYTES.set(usage["sizeBytes"], kind=kind)
+    SEGMENT_CACHE_BYTES.set(segment_cache.stats()["sizeBytes"])
+
+@app.get("/metrics")
+async def get_metrics():
+    await asyncio.to_thread(refresh_disk_metrics)
+    lines = [line for metric in metrics_registry for line in metric.render()]
+    return PlainTextResponse("\n".join(lines) + "\n", media_type="text/plain; version=0.0.4")
+
+@app.get("/storage/stats")
+async def get_storage_stats():
+    return await asyncio.to_thread(storage_manager.stats)
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = get_render_job(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] not in ("queued", "running"):
+        raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+    
+    conn = get_db()
+    now = time.time()
+    # A queued job is cancelled outright; no worker can claim it afterwards
+    cursor = conn.execute(
+        "UPDATE render_jobs SET status = 'cancelled', cancel_requested = 1, updated_at = ? "
+        "WHERE id = ? AND status = 'queued'",
+        (now, job_id)
+    )
+    if cursor.rowcount == 1:
+        future = render_futures.pop(job_id, None)
+        if future is not None:
+            future.cancel()
+        render_cancel_events.pop(job_id, None)
+        storage_manager.release_references("job", job_id)
+        release_job_limit(job_id)
+        status = "cancelled"
+    else:
+        # The worker that owns a running job sees the flag and records the cancellation
+        cursor = conn.execute(
+            "UPDATE render_jobs SET cancel_requested = 1, updated_at = ? WHERE id = ? AND status = 'running'",
+            (now, job_id)
+        )
+        if cursor.rowcount == 0:
+            job = get_render_job(job_id)
+            raise HTTPException(status_code=409, detail=f"Job is already {job['status']}")
+        cancel_event = render_cancel_events.get(job_id)
+        if cancel_event is not None:
+            cancel_event.set()
+        status = "cancelling"
+    
+    logger.info(f"Cancellation requested for job {job_id}")
+    return {"jobId": job_id, "status": status}
+
+def fit_image_to_canvas(image, width: int, height: int):
+    """Scale an image to fit the canvas, keeping its aspect ratio, and pad it with black"""
+    scale = min(width / image.width, height / image.height)
+    scaled_size = (
+        max(1, min(width, round(image.width * scale))),
+        max(1, min(height, round(image.height * scale)))
+    )
+    if scaled_size != image.size:
+        image = image.resize(scaled_size, PILImage.LANCZOS)
+    
+    canvas = PILImage.new("RGB", (width, height), "black")
+    canvas.paste(image, ((width - scaled_size[0]) // 2, (height - scaled_size[1]) // 2))
+    return canvas
+
+def normalize_scene_image(image_path, width: int, height: int) -> Path:
+    """Return a cached, canvas-sized RGB frame for an image at the given output size"""
+    frame_key = hashlib.sha256(f"{file_sha256(image_path)}:{width}x{height}".encode()).hexdigest()
+    frame_path = FRAME_CACHE_DIR / f"{frame_key}.png"
+    if frame_path.exists():
+        storage_manager.touch(frame_path, write_through=True)
+        return frame_path
+    
+    with PILImage.open(image_path) as img:
+        frame = fit_image_to_canvas(img.convert("RGB"), width, height)
+    
+    # Write under a unique name first so parallel renders never read a partial frame
+    partial_path = frame_path.with_name(f"{frame_key}.{uuid.uuid4().hex}.tmp.png")
+    frame.save(partial_path, optimize=False)
+    os.replace(partial_path, frame_path)
+    storage_manager.register(frame_path, "frame")
+    return frame_path
+
+def parse_caption_color(value: str) -> tuple:
+    """Convert an FFmpeg color such as "black@0.9" into an RGBA tuple"""
+    name, _, alpha = value.partition("@")
+    red, green, blue = ImageColor.getrgb(name)[:3]
+    return red, green, blue, round(float(alpha or 1) * 255)
+
+def load_caption_font(size: int):
+    """Load the caption font at a pixel size, falling back to PIL's built-in font"""
+    try:
+        return ImageFont.truetype(FONT_PATH, size)
+    except OSError:
+        logger.warning(f"Caption font {FONT_PATH} not found, using the default font")
+        return ImageFont.load_default(size=size)
+
+def wrap_caption_text(text: str, font, max_width: float) -> list:
+    """Break text into lines that fit max_width pixels when drawn with font"""
+    lines = []
+    current_line = []
+    for word in text.split():
+        candidate = " ".join(current_line + [word])
+        if current_line and font.getlength(candidate) > max_width:
+            lines.append(" ".join(current_line))
+            current_line = [word]
+        else:
+            current_line.append(word)
+    if current_line:
+        lines.append(" ".join(current_line))
+    return lines
+
+def render_caption_overlay(text: str, caption_config: dict, width: int, height: int) -> Path:
+    """Lay out a caption once into a cached, transparent, canvas-sized overlay"""
+    overlay_key = hashlib.sha256(json.dumps({
+        "text": text,
+        "settings": caption_config,
+        "size": [width, height],
+        "font": FONT_FILE
+    }, sort_keys=True).encode()).hexdigest()
+    overlay_path = CAPTION_CACHE_DIR / f"{overlay_key}.png"
+    if overlay_path.exists():
+        storage_manager.touch(overlay_path, write_through=True)
+        return overlay_path
+    
+    font = load_caption_font(caption_config["font_size"])
+    max_width = width * caption_config["max_width_ratio"]
+    bottom_margin = caption_config["bottom_margin"]
+    padding = caption_config["box_padding"]
+    border_width = caption_config["border_width"]
+    
+    lines = wrap_caption_text(text, font, max_width - 2 * (padding + border_width))
+    ascent, descent = font.getmetrics()
+    line_height = ascent + descent
+    spacing = caption_config["line_spacing"]
+    text_height = len(lines) * line_height + (len(lines) - 1) * spacing
+    line_widths = [font.getlength(line) for line in lines]
+    block_width = max(line_widths)
+    top = height - bottom_margin - text_height
+    
+    overlay = PILImage.new("RGBA", (width, height), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(overlay)
+    draw.rectangle(
+        (
+            (width - block_width) / 2 - padding, top - padding,
+            (width + block_width) / 2 + padding, top + text_height + padding
+        ),
+        fill=(0, 0, 0, round(caption_config["box_opacity"] * 255))
+    )
+    for index, (line, line_width) in enumerate(zip(lines, line_widths)):
+        x = (width - line_width) / 2
+        y = top + index * (line_height + spacing)
+        # Shadow for better readability
+        draw.text((x + 2, y + 2), line, font=font, fill=(0, 0, 0, round(0.7 * 255)))
+        draw.text(
+            (x, y), line, font=font,
+            fill=parse_caption_color(caption_config["font_color"]),
+            stroke_width=border_width,
+            stroke_fill=parse_caption_color(caption_config["border_color"])
+        )
+    
+    partial_path = overlay_path.with_name(f"{overlay_key}.{uuid.uuid4().hex}.tmp.png")
+    overlay.save(partial_path)
+    os.replace(partial_path, overlay_path)
+    storage_manager.register(overlay_path, "caption")
+    return overlay_path
+
+def compose_caption_frame(frame_path: Path, overlay_path: Path) -> Path:
+    """Composite a caption overlay onto a normalized scene frame, once per pair"""
+    composed_path = FRAME_CACHE_DIR / f"{frame_path.stem}_{overlay_path.stem[:16]}.png"
+    if composed_path.exists():
+        storage_manager.touch(composed_path, write_through=True)
+        return composed_path
+    
+    with PILImage.open(frame_path) as frame, PILImage.open(overlay_path) as overlay:
+        composed = PILImage.alpha_composite(frame.convert("RGBA"), overlay).convert("RGB")
+    partial_path = composed_path.with_name(f"{composed_path.stem}.{uuid.uuid4().hex}.tmp.png")
+    composed.save(partial_path)
+    os.replace(partial_path, composed_path)
+    storage_manager.register(composed_path, "frame")
+    return composed_path
+
+def prepare_scene_frame(i, scene_plan, render_config) -> tuple:
+    """Canvas-sized frame for a scene, captioned when possible; returns (frame, drawtext filter or None)"""
+    video_width = render_config["width"]
+    video_height = render_config["height"]
+    voiceover = scene_plan["voiceover"]
+    
+    # Scale and pad the image to the canvas once instead of on every frame
+    with RENDER_STAGE_SECONDS.time(stage="frame"):
+        frame_path = normalize_scene_image(scene_plan["image"], video_width, video_height)
+
+    # Burn the caption into the frame with one composite instead of per-frame drawtext
+    caption_filter = None
+    if voiceover and CAPTION_RENDERER == "overlay":
+        try:
+            with RENDER_STAGE_SECONDS.time(stage="caption"):
+                overlay_path = render_caption_overlay(
+                    voiceover, render_config["captions"], video_width, video_height
+                )
+                frame_path = compose_caption_frame(frame_path, overlay_path)
+        except Exception as e:
+            CAPTION_FALLBACKS_TOTAL.inc(to="drawtext")
+            logger.warning(f"Scene {i}: Caption overlay failed, falling back to drawtext: {e}")
+            caption_filter = build_caption_filter(voiceover, render_config["captions"])
+    elif voiceover:
+        caption_filter = build_caption_filter(voiceover, render_config["captions"])
+    return frame_path, caption_filter
+
+def render_scene(i, scene_plan, render_config, temp_dir, threads, use_cache=True,
+                 cancel_event=None, on_progress=None):
+    """Render one planned scene to its own segment in temp_dir"""
+    logger.info(f"Processing scene {i}")
+    
+    local_image_path = scene_plan["image"]
+    local_audio_path = scene_plan["audio"]
+    voiceover = scene_plan["voiceover"]
+    duration = scene_plan["duration"]
+
+    # Reuse an identical segment rendered by an earlier job
+    cache_key = None
+    if use_cache:
+        cache_key = segment_cache_key(local_image_path, local_audio_path, voiceover, render_config, duration)
+        cached_segment = segment_cache.lookup(cache_key)
+        if cached_segment is not None:
+            logger.info(f"Scene {i}: Reusing cached segment")
+            return cached_segment
+
+    frame_path, caption_filter = prepare_scene_frame(i, scene_plan, render_config)
+
+    # Render the scene (image loop, captions and audio) in one pass
+    scene_video = temp_dir / f"scene_{i}.mp4"
+    base_filter = 'format=yuv420p'
+
+    complete = render_scene_segment(
+        scene_index=i,
+        image_path=frame_path,
+        audio_path=local_audio_path,
+        duration=duration,
+        base_filter=base_filter,
+        caption_filter=caption_filter,
+        output_path=scene_video,
+        encoder=render_config["encoder"],
+        threads=threads,
+        cancel_event=cancel_event,
+        on_progress=on_progress
+    )
+    # A caption fallback render must not be served for the captioned key later
+    if cache_key and complete:
+        return segment_cache.store(cache_key, scene_video)
+    return scene_video
+
+def effective_transition(scene_plans, transition_seconds) -> float:
+    """Crossfade length actually used: never more than half the shortest scene"""
+    if not transition_seconds or len(scene_plans) < 2:
+        return 0
+    return round(min(transition_seconds, min(plan["duration"] for plan in scene_plans) / 2), 3)
+
+def timeline_duration(scene_plans, transition_seconds=0) -> float:
+    """Length of the finished video; each crossfade overlaps two scenes"""
+    transition_seconds = effective_transition(scene_plans, transition_seconds)
+    return sum(plan["duration"] for plan in scene_plans) - transition_seconds * (len(scene_plans) - 1)
+
+def scene_bounds(scene_plans, transition_seconds=0) -> list:
+    """(start, end) of each scene in the finished video; a crossfade counts towards the next scene"""
+    transition_seconds = effective_transition(scene_plans, transition_seconds)
+    total_duration = timeline_duration(scene_plans, transition_seconds)
+    bounds, start = [], 0
+    for scene_plan in scene_plans[:-1]:
+        end = min(total_duration, start + scene_plan["duration"] - transition_seconds)
+        bounds.append((start, end))
+        start = end
+    # No crossfade follows the last scene
+    if scene_plans:
+        bounds.append((start, total_duration))
+    return bounds
+
+def build_timeline_command(scene_plans, outputs, transition_seconds=0) -> list:
+    """One FFmpeg command that renders every scene, its captions and the joins into each output
+    
+    outputs holds one dict per rendition with the scene "frames" from
+    prepare_scene_frame, its "encoder" settings and the output "path". The
+    voiceovers are decoded and joined once and split between the outputs.
+    """
+    count = len(scene_plans)
+    transition_seconds = effective_transition(scene_plans, transition_seconds)
+    cmd = ['ffmpeg', '-y']
+    for output in outputs:
+        encoder = output["encoder"]
+        # xfade mistimes inputs looped at the low still-image rate, so crossfades read frames at full rate
+        input_fps = encoder["fps"] if transition_seconds else encoder["source_fps"]
+        for (frame_path, _), plan in zip(output["frames"], scene_plans):
+            if encoder["still_mode"] != "off":
+                cmd += ['-framerate', str(input_fps)]
+            cmd += ['-loop', '1', '-t', str(plan["duration"]), '-i', str(frame_path)]
+    audio_input = count * len(outputs)
+    for plan in scene_plans:
+        cmd += ['-i', str(plan["audio"])]
+    
+    # Audio settings are the same for every profile; only the bitrate differs
+    encoder = outputs[0]["encoder"]
+    channel_layout = "stereo" if encoder["audio_channels"] == 2 else "mono"
+    filters = []
+    for i, plan in enumerate(scene_plans):
+        # Pad or cut each voiceover to its scene so audio and video stay aligned
+        filters.append(
+            f'[{audio_input + i}:a]aresample={encoder["audio_sample_rate"]},'
+            f'aformat=sample_fmts=fltp:channel_layouts={channel_layout},'
+            f'apad,atrim=duration={plan["duration"]},asetpts=PTS-STARTPTS[a{i}]'
+        )
+    if transition_seconds:
+        audio_label = "a0"
+        for i in range(1, count):
+            next_audio = "a" if i == count - 1 else f"ax{i}"
+            filters.append(f'[{audio_label}][a{i}]acrossfade=d={transition_seconds}[{next_audio}]')
+            audio_label = next_audio
+    else:
+        filters.append(''.join(f'[a{i}]' for i in range(count)) + f'concat=n={count}:v=0:a=1[a]')
+    if len(outputs) > 1:
+        filters.append(f'[a]asplit={len(outputs)}' + ''.join(f'[a_{k}]' for k in range(len(outputs))))
+    
+    output_args = []
+    for k, output in enumerate(outputs):
+        encoder = output["encoder"]
+        for i, ((_, caption_filter), plan) in enumerate(zip(output["frames"], scene_plans)):
+            video_filter = 'format=yuv420p' + (f',{caption_filter}' if caption_filter else '')
+            # -t drops the last partial input frame; clone it so trim cuts at the exact length
+            filters.append(
+                f'[{k * count + i}:v]{video_filter},'
+                f'tpad=stop_mode=clone:stop_duration={1 / encoder["source_fps"]:g},fps={encoder["fps"]},'
+                f'trim=duration={plan["duration"]},setpts=PTS-STARTPTS[v{k}_{i}]'
+            )
+        if transition_seconds:
+            video_label = f"v{k}_0"
+            offset = 0
+            for i in range(1, count):
+                offset += scene_plans[i - 1]["duration"] - transition_seconds
+                next_video = f"v_{k}" if i == count - 1 else f"vx{k}_{i}"
+                filters.append(
+                    f'[{video_label}][v{k}_{i}]xfade=transition=fade:'
+                    f'duration={transition_seconds}:offset={offset:.3f}[{next_video}]'
+                )
+                video_label = next_video
+        else:
+            filters.append(''.join(f'[v{k}_{i}]' for i in range(count)) + f'concat=n={count}:v=1:a=0[v_{k}]')
+        audio_label = f"[a_{k}]" if len(outputs) > 1 else "[a]"
+        output_args += (
+            ['-map', f'[v_{k}]', '-map', audio_label]
+            + video_encoder_args(encoder) + audio_encoder_args(encoder)
+            + ['-movflags', '+faststart', str(output["path"])]
+        )
+    
+    return cmd + ['-filter_complex', ';'.join(filters)] + output_args
+
+def render_timeline(scene_plans, renditions, transition_seconds=0, progress=None, cancel_event=None):
+    """Render the whole video in one FFmpeg run: no segments, concat list or scratch files
+    
+    renditions holds (render_config, video_path) pairs; all of them are
+    written by the same FFmpeg process.
+    """
+    outputs = []
+    for render_config, video_path in renditions:
+        frames = []
+        for i, scene_plan in enumerate(scene_plans, 1):
+            if cancel_event is not None and cancel_event.is_set():
+                raise RenderCancelled()
+            frames.append(prepare_scene_frame(i, scene_plan, render_config))
+        outputs.append({"frames": frames, "encoder": render_config["encoder"], "path": video_path})
+    
+    # Output time ranges of each scene, to turn FFmpeg's position into scene progress
+    transition_seconds = effective_transition(scene_plans, transition_seconds)
+    total_duration = timeline_duration(scene_plans, transition_seconds)
+    bounds = scene_bounds(scene_plans, transition_seconds)
+    reported = set()
+    
+    def report(percent, speed):
+        if progress is None or percent is None:
+            return
+        position = percent / 100 * total_duration
+        for i, (scene_start, scene_end) in enumerate(bounds, 1):
+            if i in reported:
+                continue
+            if position >= scene_end or percent >= 100:
+                reported.add(i)
+                progress.scene(i, "completed")
+            elif position >= scene_start:
+                progress.encoding(i, (position - scene_start) / max(scene_end - scene_start, 0.001) * 100, speed)
+    
+    def remove_outputs():
+        for output in outputs:
+            Path(output["path"]).unlink(missing_ok=True)
+    
+    if progress is not None:
+        for i in range(1, len(scene_plans) + 1):
+            progress.scene(i, "rendering")
+    try:
+        try:
+            with RENDER_STAGE_SECONDS.time(stage="timeline_encode"):
+                run_ffmpeg(
+                    build_timeline_command(scene_plans, outputs, transition_seconds),
+                    total_duration, cancel_event, report
+                )
+        except FFmpegTimeout:
+            raise
+        except subprocess.CalledProcessError as e:
+            caption_count = sum(1 for output in outputs for _, caption_filter in output["frames"] if caption_filter)
+            if not caption_count:
+                raise
+            FFMPEG_FAILURES_TOTAL.inc(stage="timeline_captions")
+            CAPTION_FALLBACKS_TOTAL.inc(caption_count, to="none")
+            log_ffmpeg_error(e, "timeline render with captions")
+            logger.warning("Falling back to a timeline render without drawtext captions")
+            for output in outputs:
+                output["frames"] = [(frame_path, None) for frame_path, _ in output["frames"]]
+            with RENDER_STAGE_SECONDS.time(stage="timeline_encode"):
+                run_ffmpeg(
+                    build_timeline_command(scene_plans, outputs, transition_seconds),
+                    total_duration, cancel_event, report
+                )
+    except subprocess.CalledProcessError as e:
+        FFMPEG_FAILURES_TOTAL.inc(stage="timeline")
+        log_ffmpeg_error(e, "timeline render")
+        remove_outputs()
+        raise Exception("Failed to render the video timeline")
+    except RenderCancelled:
+        remove_outputs()
+        raise
+    
+    try:
+        for output in outputs:
+            check_av_sync(output["path"])
+    except Exception:
+        remove_outputs()
+        raise
+    
+    if progress is not None:
+        for i in range(1, len(scene_plans) + 1):
+            if i not in reported:
+                progress.scene(i, "completed")
+
+def get_threads_per_job(worker_count: int) -> int:
+    """Number of x264 threads per scene encode so parallel jobs don't oversubscribe cores"""
+    if RENDER_THREADS_PER_JOB > 0:
+        return RENDER_THREADS_PER_JOB
+    return max(1, (os.cpu_count() or 1) // worker_count)
+
+def render_scene_tracked(i, scene_plan, render_config, temp_dir, threads, use_cache=True,
+                         progress=None, cancel_event=None):
+    """Render one scene, honouring cancellation and reporting progress"""
+    if cancel_event is not None and cancel_event.is_set():
+        raise RenderCancelled()
+    on_progress = None
+    if progress is not None:
+        progress.scene(i, "rendering")
+        on_progress = lambda percent, speed: progress.encoding(i, percent, speed)
+    try:
+        scene_video = render_scene(
+            i, scene_plan, render_config, temp_dir, threads, use_cache, cancel_event, on_progress
+        )
+    except RenderCancelled:
+        if progress is not None:
+            progress.scene(i, "cancelled")
+        raise
+    except Exception:
+        if progress is not None:
+            progress.scene(i, "failed")
+        raise
+    if progress is not None:
+        progress.scene(i, "completed")
+    return scene_video
+
+def render_scenes_parallel(scene_plans, render_config, temp_dir, worker_count, threads, use_cache=True,
+                           progress=None, cancel_event=None, on_scene=None):
+    """Render all scenes on a bounded worker pool and return segments in scene order
+    
+    on_scene(index, segment) is called as each scene finishes, in completion order.
+    """
+    scene_videos = [None] * len(scene_plans)
+    failures = {}
+    
+    with ThreadPoolExecutor(max_workers=worker_count, thread_name_prefix="render") as executor:
+        futures = {
+            executor.submit(
+                render_scene_tracked, i, scene_plan, render_config, temp_dir, threads, use_cache,
+                progress, cancel_event
+            ): i
+            for i, scene_plan in enumerate(scene_plans, 1)
+        }
+        for future in as_completed(futures):
+            i = futures[future]
+            if future.cancelled():
+                continue
+            try:
+                scene_videos[i - 1] = future.result()
+                if on_scene is not None:
+                    on_scene(i, scene_videos[i - 1])
+            except RenderCancelled:
+                for other in futures:
+                    other.cancel()
             except Exception as e:
                 logger.error(f"Error processing scene {i}: {str(e)}", exc_info=True)
-                raise
+                failures[i] = e
+                # Skip scenes after the failed one that haven't started yet; earlier
+                # scenes keep running so the lowest failing index is always reported
+                for other, j in futures.items():
+                    if j > i:
+                        other.cancel()
+    
+    if (cancel_event is not None and cancel_event.is_set()) or failures:
+        # The caller never sees these segments, so unpin them here
+        for video in scene_videos:
+            if video is not None:
+                segment_cache.release(video)
+        if failures:
+            raise failures[min(failures)]
+        raise RenderCancelled()
+    return scene_videos
+
+def check_av_sync(path):
+    """Fail a render whose video and audio streams differ in length by more than the tolerance"""
+    durations = {
+        stream["codec_type"]: float(stream["duration"])
+        for stream in run_ffprobe(path)["streams"] if stream.get("duration")
+    }
+    if "video" in durations and "audio" in durations:
+        drift = abs(durations["video"] - durations["audio"])
+        if drift > AV_SYNC_TOLERANCE_SECONDS:
+            raise Exception(
+                f"{Path(path).name}: video is {durations['video']:.3f}s but audio is "
+                f"{durations['audio']:.3f}s"
+            )
+
+def run_ffprobe(path) -> dict:
+    """Read stream and container information with ffprobe"""
+    result = subprocess.run(
+        [
+            'ffprobe', '-v', 'error',
+            '-show_streams', '-show_format',
+            '-of', 'json',
+            str(path)
+        ],
+        check=True, capture_output=True, timeout=FFPROBE_TIMEOUT_SECONDS
+    )
+    return json.loads(result.stdout)
+
+_probe_memo = {}
+_probe_memo_lock = threading.Lock()
+
+def init_probe_cache():
+    """Create the table of probe results keyed by file content hash"""
+    get_db().execute("""
+        CREATE TABLE IF NOT EXISTS media_probe (
+            file_hash TEXT PRIMARY KEY,
+            info TEXT NOT NULL,
+            probed_at REAL NOT NULL
+        )
+    """)
+
+def probe_media(path) -> dict:
+    """ffprobe information for a file, probed once per distinct file content"""
+    file_hash = file_sha256(path)
+    with _probe_memo_lock:
+        if file_hash in _probe_memo:
+            return _probe_memo[file_hash]
+    
+    row = get_db().execute("SELECT info FROM media_probe WHERE file_hash = ?", (file_hash,)).fetchone()
+    if row is not None:
+        info = json.loads(row["info"])
+    else:
+        info = run_ffprobe(path)
+        get_db().execute(
+            "INSERT OR REPLACE INTO media_probe (file_hash, info, probed_at) VALUES (?, ?, ?)",
+            (file_hash, json.dumps(info), time.time())
+        )
+    
+    with _probe_memo_lock:
+        _probe_memo[file_hash] = info
+    return info
+
+def probe_many(paths) -> dict:
+    """Probe several files concurrently; files that can't be probed map to None"""
+    def probe_or_none(path):
+        try:
+            return probe_media(path)
+        except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError, OSError) as e:
+            logger.warning(f"Could not probe {path}: {e}")
+            return None
+    
+    unique_paths = list(dict.fromkeys(paths))
+    if not unique_paths:
+        return {}
+    with ThreadPoolExecutor(max_workers=min(8, len(unique_paths)), thread_name_prefix="probe") as executor:
+        return dict(zip(unique_paths, executor.map(probe_or_none, unique_paths)))
+
+def media_duration(info):
+    """Duration in seconds from probe information, or None if unknown"""
+    if not info:
+        return None
+    durations = [info.get("format", {}).get("duration")]
+    durations += [stream.get("duration") for stream in info.get("streams", [])]
+    values = [float(value) for value in durations if value not in (None, "N/A")]
+    return max(values) if values else None
+
+def parse_scene_time(time_str):
+    """Length in seconds of a "start-end" time range, or None if it can't be parsed"""
+    try:
+        time_parts = time_str.split('-')
+        if len(time_parts) != 2:
+            return None
+        duration = extract_seconds(time_parts[1]) - extract_seconds(time_parts[0])
+    except (AttributeError, ValueError):
+        return None
+    return duration if duration > 0 else None
+
+def local_asset_path(url: str) -> Path:
+    """Convert an asset URL from the frontend into a local path"""
+    return Path(url.replace('http://localhost:8000', '').lstrip('/'))
+
+def plan_scenes(scenes) -> list:
+    """Validate scenes, batch-probe their assets and decide each scene's duration"""
+    scene_inputs = []
+    for i, scene in enumerate(scenes, 1):
+        # Validate required scene properties
+        if not isinstance(scene, dict):
+            raise ValueError(f"Scene {i} is not a valid dictionary")
         
-        logger.info("All scenes processed, creating final video")
+        image_url = scene.get('imageUrl', '')
+        audio_url = scene.get('audioUrl', '')
+        if not image_url or not audio_url:
+            raise ValueError(f"Scene {i} missing required image or audio URL")
         
-        # Create concat file
-        concat_file = temp_dir / "concat.txt"
-        with open(concat_file, 'w') as f:
-            for video in scene_videos:
-                f.write(f"file '{video.absolute()}'\n")
+        image_path = local_asset_path(image_url)
+        audio_path = local_asset_path(audio_url)
+        if not image_path.exists():
+            raise Exception(f"Image file not found: {image_url}")
+        if not audio_path.exists():
+            raise Exception(f"Audio file not found: {audio_url}")
+        scene_inputs.append((scene, image_path, audio_path))
+        storage_manager.touch(image_path, write_through=True)
+        storage_manager.touch(audio_path, write_through=True)
+    
+    probes = probe_many([audio_path for _, _, audio_path in scene_inputs])
+    
+    scene_plans = []
+    for i, (scene, image_path, audio_path) in enumerate(scene_inputs, 1):
+        script_duration = parse_scene_time(scene.get('time'))
+        audio_duration = media_duration(probes.get(audio_path))
+        if audio_duration is not None:
+            audio_duration = round(audio_duration, 3)
+        
+        if SCENE_TIMING == "audio":
+            duration = audio_duration or script_duration
+        else:
+            duration = script_duration or audio_duration
+        if not duration:
+            logger.warning(f"Scene {i} has no usable time or audio length, using default duration")
+            duration = DEFAULT_SCENE_DURATION
         
-        # Final concatenation command
-        concat_cmd = [
+        scene_plans.append({
+            "image": image_path,
+            "audio": audio_path,
+            "voiceover": scene.get('voiceover', ''),
+            "duration": duration,
+            "audioDuration": audio_duration,
+            "imageSize": get_image_dimensions(image_path)
+        })
+    return scene_plans
+
+def segment_signature(path) -> tuple:
+    """Codec parameters that must match across segments for a stream-copy concat"""
+    # Segments are probed directly; hashing them for the probe cache costs more than it saves
+    streams = run_ffprobe(path)["streams"]
+    signature = []
+    for stream in sorted(streams, key=lambda item: item["codec_type"]):
+        if stream["codec_type"] == "video":
+            signature.append((
+                "video", stream.get("codec_name"), stream.get("profile"),
+                stream.get("width"), stream.get("height"), stream.get("pix_fmt"),
+                stream.get("r_frame_rate"), stream.get("time_base")
+            ))
+        elif stream["codec_type"] == "audio":
+            signature.append((
+                "audio", stream.get("codec_name"), stream.get("sample_rate"),
+                stream.get("channels"), stream.get("channel_layout")
+            ))
+    return tuple(signature)
+
+def segments_are_uniform(segments) -> bool:
+    """Check that every segment can be joined with -c copy"""
+    try:
+        signatures = {segment_signature(segment) for segment in segments}
+    except (subprocess.CalledProcessError, subprocess.TimeoutExpired, ValueError, KeyError) as e:
+        logger.warning(f"Could not probe scene segments: {e}")
+        return False
+    if len(signatures) > 1:
+        logger.warning(f"Scene segments have mismatched parameters: {signatures}")
+    return len(signatures) == 1
+
+def concatenate_segments(scene_videos, concat_file: Path, video_path: Path, encoder: dict,
+                         duration=None, cancel_event=None):
+    """Join scene segments, stream-copying when they share codec parameters"""
+    if segments_are_uniform(scene_videos):
+        copy_cmd = [
             'ffmpeg', '-y',
             '-f', 'concat',
             '-safe', '0',
             '-i', str(concat_file),
-            '-c:v', 'libx264',
-            '-preset', 'slow',
-            '-crf', '18',
-            '-c:a', 'aac',
-            '-b:a', '192k',
+            '-c', 'copy',
+            '-movflags', '+faststart',
             str(video_path)
         ]
+        try:
+            with RENDER_STAGE_SECONDS.time(stage="concat"):
+                run_ffmpeg(copy_cmd, duration, cancel_event)
+            logger.info("Concatenated scenes with stream copy")
+            return
+        except subprocess.CalledProcessError as e:
+            FFMPEG_FAILURES_TOTAL.inc(stage="concat_copy")
+            log_ffmpeg_error(e, "final video stream-copy concatenation")
+            logger.warning("Falling back to re-encoding the final video")
+    
+    # Final concatenation command
+    concat_cmd = [
+        'ffmpeg', '-y',
+        '-f', 'concat',
+        '-safe', '0',
+        '-i', str(concat_file),
+        '-c:v', encoder["video_codec"],
+        '-preset', encoder["preset"],
+        '-crf', str(encoder["crf"]),
+        '-pix_fmt', encoder["pix_fmt"],
+        '-r', str(encoder["fps"]),
+        '-c:a', encoder["audio_codec"],
+        '-b:a', encoder["audio_bitrate"],
+        '-movflags', '+faststart',
+        str(video_path)
+    ]
+    
+    try:
+        with RENDER_STAGE_SECONDS.time(stage="concat"):
+            run_ffmpeg(concat_cmd, duration, cancel_event)
+    except subprocess.CalledProcessError as e:
+        FFMPEG_FAILURES_TOTAL.inc(stage="concat")
+        log_ffmpeg_error(e, "final video concatenation")
+        raise Exception("Failed to concatenate videos")
+
+class ScratchQuotaError(Exception):
+    """Raised when there isn't enough scratch space to start a render"""
+
+active_scratch_dirs = set()
+scratch_reservations = {}
+scratch_lock = threading.Lock()
+
+def estimate_scratch_bytes(scene_plans, render_config: dict) -> int:
+    """Rough upper bound of the scratch space a render needs, scaled to its output size"""
+    pixels_ratio = (render_config["width"] * render_config["height"]) / (1920 * 1080)
+    total_duration = sum(plan["duration"] for plan in scene_plans)
+    return int(total_duration * SCRATCH_BYTES_PER_SECOND * max(pixels_ratio, 0.1)) + 1024 * 1024
+
+def check_scratch_quota(required_bytes: int):
+    """Refuse to start a render that would overrun the scratch filesystem or quota"""
+    reserved = sum(scratch_reservations.values())
+    if SCRATCH_QUOTA_BYTES and reserved + required_bytes > SCRATCH_QUOTA_BYTES:
+        raise ScratchQuotaError(
+            f"Scratch quota exceeded: {reserved + required_bytes} of {SCRATCH_QUOTA_BYTES} bytes needed"
+        )
+    free_bytes = shutil.disk_usage(SCRATCH_ROOT).free
+    if free_bytes - reserved - required_bytes < SCRATCH_MIN_FREE_BYTES:
+        raise ScratchQuotaError(
+            f"Not enough scratch space in {SCRATCH_ROOT}: {free_bytes} bytes free, "
+            f"{required_bytes} needed plus {SCRATCH_MIN_FREE_BYTES} reserve"
+        )
+
+@contextmanager
+def scratch_workspace(job_id: str, required_bytes: int):
+    """A private scratch directory for one render, removed however the render ends"""
+    SCRATCH_ROOT.mkdir(parents=True, exist_ok=True)
+    workspace = SCRATCH_ROOT / f"job_{job_id}"
+    # The owner file lets the sweeper spot workspaces left behind by killed processes.
+    # Write it before the workspace appears so other workers never see it without one
+    staging = SCRATCH_ROOT / f".job_{job_id}.{uuid.uuid4().hex}.tmp"
+    staging.mkdir()
+    try:
+        (staging / ".owner").write_text(json.dumps({"pid": os.getpid(), "created": time.time()}))
+        with scratch_lock:
+            check_scratch_quota(required_bytes)
+            if workspace.exists():
+                raise FileExistsError(f"Scratch workspace already exists: {workspace}")
+            staging.rename(workspace)
+            active_scratch_dirs.add(workspace)
+            scratch_reservations[workspace] = required_bytes
+    finally:
+        shutil.rmtree(staging, ignore_errors=True)
+    logger.info(f"Created scratch workspace {workspace}")
+    
+    try:
+        yield workspace
+    finally:
+        shutil.rmtree(workspace, ignore_errors=True)
+        with scratch_lock:
+            active_scratch_dirs.discard(workspace)
+            scratch_reservations.pop(workspace, None)
+        logger.info("Cleaned up temporary files")
+
+def process_alive(pid: int) -> bool:
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def sweep_scratch_orphans() -> int:
+    """Remove scratch workspaces whose owning process is gone or that outlived the age limit"""
+    if not SCRATCH_ROOT.exists():
+        return 0
+    removed = 0
+    now = time.time()
+    # Staging directories only outlive scratch_workspace when a process dies mid-setup
+    for workspace in [*SCRATCH_ROOT.glob("job_*"), *SCRATCH_ROOT.glob(".job_*.tmp")]:
+        with scratch_lock:
+            if workspace in active_scratch_dirs:
+                continue
+        try:
+            owner = {} if workspace.name.startswith(".") else json.loads((workspace / ".owner").read_text())
+        except (OSError, ValueError):
+            owner = {}
+        try:
+            created = owner.get("created") or workspace.stat().st_mtime
+        except OSError:
+            continue  # Removed since the glob
         
+        # A pid from this process that isn't active was left by a crashed render thread.
+        # Without a pid only age counts, as another worker may own it
+        pid = owner.get("pid")
+        orphaned = (
+            (pid is not None and (pid == os.getpid() or not process_alive(pid)))
+            or now - created > SCRATCH_ORPHAN_AGE_SECONDS
+        )
+        if orphaned:
+            shutil.rmtree(workspace, ignore_errors=True)
+            removed += 1
+    if removed:
+        logger.info(f"Removed {removed} orphaned scratch workspaces from {SCRATCH_ROOT}")
+    return removed
+
+async def run_periodic_maintenance():
+    """Background loop for housekeeping that must keep running while the server is up"""
+    while True:
+        await asyncio.sleep(MAINTENANCE_INTERVAL_SECONDS)
         try:
-            subprocess.run(concat_cmd, check=True, capture_output=True)
+            await asyncio.to_thread(sweep_scratch_orphans)
+            await asyncio.to_thread(storage_manager.sweep)
+        except Exception as e:
+            logger.error(f"Maintenance task failed: {str(e)}", exc_info=True)
+
+def fragment_offset(path) -> int:
+    """Byte offset of the first moof box, where the init section of a fragmented MP4 ends"""
+    with open(path, 'rb') as f:
+        offset = 0
+        while True:
+            header = f.read(8)
+            if len(header) < 8:
+                raise ValueError(f"No fragments in {path}")
+            size, box_type = struct.unpack('>I4s', header)
+            if box_type == b'moof':
+                return offset
+            if size == 1:
+                size = struct.unpack('>Q', f.read(8))[0]
+            elif size < 8:
+                raise ValueError(f"Unsupported box in {path}")
+            offset += size
+            f.seek(offset)
+
+class ProgressivePlaylist:
+    """HLS event playlist that grows as scene segments finish
+    
+    Each finished scene is remuxed without re-encoding into a fragmented
+    MP4 at its offset on the timeline, listed with byte ranges for its init
+    section and fragments. Only the unbroken run of scenes from the start
+    is listed, so players never reach a gap; the playlist is closed once
+    the last scene is published.
+    """
+    
+    def __init__(self, directory: Path, scene_plans, progress=None):
+        self.directory = Path(directory)
+        self.path = self.directory / "playlist.m3u8"
+        self.durations = [plan["duration"] for plan in scene_plans]
+        self.progress = progress
+        self.ready = {}  # Finished scenes waiting for an earlier one
+        self.ranges = []  # (init size, file size) of each published segment
+        self.published = 0
+        self.failed = False
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._write()
+    
+    @property
+    def finished(self) -> bool:
+        return self.published == len(self.durations)
+    
+    def add(self, index: int, scene_video):
+        """Publish a finished scene, along with any later ones it was holding back"""
+        if self.failed:
+            return
+        self.ready[index] = scene_video
+        while self.published + 1 in self.ready:
+            number = self.published + 1
+            try:
+                self.ranges.append(self._remux(number, self.ready.pop(number)))
+            except Exception as e:
+                # Playback stalls on this scene; the final MP4 is unaffected
+                self.failed = True
+                logger.warning(f"Could not publish scene {number} to {self.path}: {str(e)}")
+                return
+            self.published = number
+            self._write()
+            if self.progress is not None:
+                self.progress.streamed(number)
+    
+    def size(self) -> int:
+        return sum(entry.stat().st_size for entry in os.scandir(self.directory) if entry.is_file())
+    
+    def remove(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+    
+    def _segment_name(self, number: int) -> str:
+        return f"segment_{number:03d}.mp4"
+    
+    def _remux(self, number: int, scene_video) -> tuple:
+        segment_path = self.directory / self._segment_name(number)
+        offset = sum(self.durations[:number - 1])
+        run_ffmpeg(
+            [
+                'ffmpeg', '-y', '-i', str(scene_video),
+                '-map', '0', '-c', 'copy', '-output_ts_offset', f'{offset:.3f}',
+                '-movflags', '+frag_keyframe+empty_moov+default_base_moof',
+                '-f', 'mp4', str(segment_path)
+            ],
+            self.durations[number - 1]
+        )
+        return fragment_offset(segment_path), segment_path.stat().st_size
+    
+    def _write(self):
+        lines = [
+            "#EXTM3U",
+            "#EXT-X-VERSION:7",
+            "#EXT-X-PLAYLIST-TYPE:EVENT",
+            f"#EXT-X-TARGETDURATION:{math.ceil(max(self.durations, default=1))}",
+            "#EXT-X-MEDIA-SEQUENCE:0"
+        ]
+        for number, (init_size, size) in enumerate(self.ranges, 1):
+            # Every scene is a separate encode with its own init section
+            if number > 1:
+                lines.append("#EXT-X-DISCONTINUITY")
+            name = self._segment_name(number)
+            lines += [
+                f'#EXT-X-MAP:URI="{name}",BYTERANGE="{init_size}@0"',
+                f"#EXTINF:{self.durations[number - 1]:.3f},",
+                f"#EXT-X-BYTERANGE:{size - init_size}@{init_size}",
+                name
+            ]
+        if self.finished:
+            lines.append("#EXT-X-ENDLIST")
+        # Players poll the playlist, so never let them read a half-written one
+        temp_path = self.path.with_suffix(".tmp")
+        temp_path.write_text("\n".join(lines) + "\n")
+        os.replace(temp_path, self.path)
+
+def format_vtt_timestamp(seconds: float) -> str:
+    milliseconds = round(seconds * 1000)
+    hours, milliseconds = divmod(milliseconds, 3600 * 1000)
+    minutes, milliseconds = divmod(milliseconds, 60 * 1000)
+    return f"{hours:02d}:{minutes:02d}:{milliseconds / 1000:06.3f}"
+
+def render_previews(scene_plans, render_config, video_path, transition_seconds=0) -> dict:
+    """Poster, per-scene thumbnails and a seek-preview sprite sheet with its WebVTT index
+    
+    Every image comes from the cached canvas-sized scene frames, so the
+    rendered video is never decoded. Files are named after the video and
+    removed with it.
+    """
+    stem = Path(video_path).stem
+    width, height = render_config["width"], render_config["height"]
+    frames = [normalize_scene_image(plan["image"], width, height) for plan in scene_plans]
+    url = lambda path: f"http://localhost:8000/static/videos/previews/{path.name}"
+    
+    poster_path = PREVIEWS_DIR / f"{stem}_poster.webp"
+    with PILImage.open(frames[0]) as frame:
+        frame.save(poster_path, "WEBP", quality=IMAGE_WEBP_QUALITY)
+    
+    thumbnail_size = (PREVIEW_THUMBNAIL_WIDTH, max(1, round(PREVIEW_THUMBNAIL_WIDTH * height / width)))
+    tile_size = (PREVIEW_SPRITE_TILE_WIDTH, max(1, round(PREVIEW_SPRITE_TILE_WIDTH * height / width)))
+    thumbnail_paths = []
+    tiles = {}  # Scene index -> sprite tile
+    for i, frame_path in enumerate(frames, 1):
+        with PILImage.open(frame_path) as frame:
+            thumbnail = frame.convert("RGB").resize(thumbnail_size, PILImage.LANCZOS)
+        thumbnail_path = PREVIEWS_DIR / f"{stem}_scene_{i:03d}.webp"
+        thumbnail.save(thumbnail_path, "WEBP", quality=IMAGE_WEBP_QUALITY)
+        thumbnail_paths.append(thumbnail_path)
+        tiles[i] = thumbnail.resize(tile_size, PILImage.LANCZOS)
+    
+    # One tile per interval, showing the scene on screen at the middle of it
+    duration = timeline_duration(scene_plans, transition_seconds)
+    interval = max(PREVIEW_SPRITE_INTERVAL_SECONDS, duration / PREVIEW_SPRITE_MAX_TILES)
+    tile_count = max(1, math.ceil(duration / interval))
+    bounds = scene_bounds(scene_plans, transition_seconds)
+    columns = min(PREVIEW_SPRITE_COLUMNS, tile_count)
+    sprite = PILImage.new("RGB", (columns * tile_size[0], math.ceil(tile_count / columns) * tile_size[1]))
+    sprite_path = PREVIEWS_DIR / f"{stem}_sprite.webp"
+    cues = ["WEBVTT", ""]
+    for n in range(tile_count):
+        start, end = n * interval, min(duration, (n + 1) * interval)
+        middle = (start + end) / 2
+        scene = next((i for i, (_, scene_end) in enumerate(bounds, 1) if middle < scene_end), len(bounds))
+        x, y = n % columns * tile_size[0], n // columns * tile_size[1]
+        sprite.paste(tiles[scene], (x, y))
+        cues += [
+            f"{format_vtt_timestamp(start)} --> {format_vtt_timestamp(end)}",
+            f"{sprite_path.name}#xywh={x},{y},{tile_size[0]},{tile_size[1]}",
+            ""
+        ]
+    sprite.save(sprite_path, "WEBP", quality=IMAGE_WEBP_QUALITY)
+    vtt_path = PREVIEWS_DIR / f"{stem}_sprite.vtt"
+    vtt_path.write_text("\n".join(cues))
+    
+    paths = [poster_path, *thumbnail_paths, sprite_path, vtt_path]
+    return {
+        "posterUrl": url(poster_path),
+        "sceneThumbnails": [url(path) for path in thumbnail_paths],
+        "spriteUrl": url(sprite_path),
+        "spriteVttUrl": url(vtt_path),
+        "spriteInterval": round(interval, 3),
+        "sizeBytes": sum(path.stat().st_size for path in paths)
+    }
+
+def new_video_path(orientation: str, render_config: dict, video_id=None) -> Path:
+    """Unique output path for a rendered video"""
+    video_id = video_id or uuid.uuid4()
+    timestamp = int(time.time())
+    return VIDEOS_DIR / f"video_{timestamp}_{video_id}_{orientation}_{render_config['quality']}.mp4"
+
+def process_scenes(scenes, orientation, quality=None, max_workers=None, progress=None,
+                   cancel_event=None, use_cache=None, scene_plans=None, job_id=None,
+                   engine=None, transition_seconds=0, playlist=None):
+    """Process scenes and generate final video
+    
+    quality selects a QUALITY_PROFILES entry (VIDEO_QUALITY by default) and
+    engine a RENDER_ENGINES entry (RENDER_ENGINE by default); crossfades of
+    transition_seconds are only available with the timeline engine.
+    progress receives per-scene and per-stage updates (see JobProgress) and
+    setting cancel_event stops the render before the next scene or stage.
+    use_cache defaults to SEGMENT_CACHE_ENABLED. scene_plans (from plan_scenes)
+    is computed here when the caller hasn't already planned the scenes.
+    Intermediates go to a scratch workspace named after job_id. Finished
+    scenes are published to playlist (a ProgressivePlaylist) when given.
+    """
+    if use_cache is None:
+        use_cache = SEGMENT_CACHE_ENABLED
+    render_config = build_render_config(orientation, quality)
+    scene_videos = []
+    
+    try:
+        if scene_plans is None:
+            scene_plans = plan_scenes(scenes)
+        
+        video_id = uuid.uuid4()
+        video_path = new_video_path(orientation, render_config, video_id)
+        video_filename = video_path.name
+        
+        if (engine or RENDER_ENGINE) == "timeline":
+            logger.info(
+                f"Rendering {len(scenes)} scenes at {render_config['width']}x{render_config['height']} "
+                f"({render_config['quality']}) as one timeline"
+            )
+            render_timeline(scene_plans, [(render_config, video_path)], transition_seconds, progress, cancel_event)
+            logger.info(f"Successfully generated final video: {video_filename}")
+            return video_path
+        
+        required_bytes = estimate_scratch_bytes(scene_plans, render_config)
+        with scratch_workspace(job_id or video_id.hex, required_bytes) as temp_dir:
+            # Render scenes in parallel; results are collected by scene index so
+            # ordering in concat.txt and the reported failure stay deterministic
+            worker_count = max(1, min(max_workers or RENDER_MAX_WORKERS, len(scenes)))
+            threads = get_threads_per_job(worker_count)
+            logger.info(
+                f"Rendering {len(scenes)} scenes at {render_config['width']}x{render_config['height']} "
+                f"({render_config['quality']}) with {worker_count} workers, {threads} threads each"
+            )
+            scene_videos = render_scenes_parallel(
+                scene_plans, render_config, temp_dir, worker_count, threads, use_cache,
+                progress, cancel_event, playlist.add if playlist is not None else None
+            )
+            
+            logger.info("All scenes processed, creating final video")
+            if cancel_event is not None and cancel_event.is_set():
+                raise RenderCancelled()
+            if progress is not None:
+                progress.stage("concatenating")
+            
+            # Create concat file
+            concat_file = temp_dir / "concat.txt"
+            with open(concat_file, 'w') as f:
+                for video in scene_videos:
+                    f.write(f"file '{video.absolute()}'\n")
+            
+            concatenate_segments(
+                scene_videos, concat_file, video_path, render_config["encoder"],
+                sum(plan["duration"] for plan in scene_plans), cancel_event
+            )
+            try:
+                check_av_sync(video_path)
+            except Exception:
+                video_path.unlink(missing_ok=True)
+                raise
             logger.info(f"Successfully generated final video: {video_filename}")
-        except subprocess.CalledProcessError as e:
-            log_ffmpeg_error(e, "final video concatenation")
-            raise Exception("Failed to concatenate videos")
         
         return video_path
         
+    except RenderCancelled:
+        raise
     except Exception as e:
         logger.error(f"Error in process_scenes: {str(e)}", exc_info=True)
         raise
     finally:
-        # Clean up temporary files
-        if temp_dir.exists():
-            shutil.rmtree(temp_dir)
-            logger.info("Cleaned up temporary files")
+        for video in scene_videos:
+            segment_cache.release(video)
+
+def process_renditions(scenes, targets, progress=None, cancel_event=None, use_cache=None,
+                       scene_plans=None, job_id=None, engine=None, transition_seconds=0,
+                       playlist=None) -> list:
+    """Render every target ({"orientation", "quality"}) of one video; returns the output paths in order
+    
+    The timeline engine writes all renditions from one FFmpeg process that
+    decodes each voiceover once. The segment engine renders the targets one
+    after another from the same scene plans, each as a progress pass; only
+    the first target is published to playlist.
+    """
+    if scene_plans is None:
+        scene_plans = plan_scenes(scenes)
+    
+    if (engine or RENDER_ENGINE) == "timeline":
+        renditions = []
+        for target in targets:
+            render_config = build_render_config(target["orientation"], target["quality"])
+            renditions.append((render_config, new_video_path(target["orientation"], render_config)))
+        logger.info(
+            f"Rendering {len(scenes)} scenes as one timeline to "
+            + ", ".join(f"{config['width']}x{config['height']} ({config['quality']})" for config, _ in renditions)
+        )
+        render_timeline(scene_plans, renditions, transition_seconds, progress, cancel_event)
+        return [video_path for _, video_path in renditions]
+    
+    video_paths = []
+    try:
+        for target in targets:
+            if video_paths and progress is not None:
+                progress.next_pass()
+            video_paths.append(process_scenes(
+                scenes, target["orientation"], target["quality"], progress=progress,
+                cancel_event=cancel_event, use_cache=use_cache, scene_plans=scene_plans,
+                job_id=job_id, engine="segments", playlist=None if video_paths else playlist
+            ))
+    except BaseException:
+        for video_path in video_paths:
+            video_path.unlink(missing_ok=True)
+        raise
+    return video_paths
 
 if __name__ == "__main__":
     import uvicorn
@@ -39,7 +39,6 @@ export default function Create() {
   const [audioUrl, setAudioUrl] = useState(null);
   const [scenes, setScenes] = useState([]);
   const [batchGenerating, setBatchGenerating] = useState(false);
-  const [currentGeneratingScene, setCurrentGeneratingScene] = useState(null);
   const [videoUrl, setVideoUrl] = useState(null);
   const [videoGenerating, setVideoGenerating] = useState(false);
   const [allScenesReady, setAllScenesReady] = useState(false);
@@ -48,6 +47,8 @@ export default function Create() {
   const [remainingGenerations, setRemainingGenerations] = useState(2);
   const [showFeedbackForm, setShowFeedbackForm] = useState(false);
   const [feedback, setFeedback] = useState({ type: '', message: '' });
+  // Namespaces this session's scenes in the backend scene store
+  const [projectId] = useState(() => crypto.randomUUID());
 
   useEffect(() => {
     // Load saved images from localStorage
@@ -92,7 +93,8 @@ export default function Create() {
         },
         credentials: 'omit',
         body: JSON.stringify({
-          prompt: visualDescription
+          prompt: visualDescription,
+          projectId
         })
       });
 
@@ -110,7 +112,7 @@ export default function Create() {
       // Save to state and localStorage
       const newGeneratedImages = {
         ...generatedImages,
-        [visualDescription]: data.imageUrl
+        [visualDescription]: data.thumbnailUrl || data.imageUrl
       };
       setGeneratedImages(newGeneratedImages);
       localStorage.setItem('generatedImages', JSON.stringify(newGeneratedImages));
@@ -212,7 +214,8 @@ export default function Create() {
         },
         credentials: 'omit',
         body: JSON.stringify({
-          prompt: imagePrompt
+          prompt: imagePrompt,
+          projectId
         })
       });
 
@@ -230,7 +233,7 @@ export default function Create() {
       // Save to state and localStorage
       const newGeneratedImages = {
         ...generatedImages,
-        [imagePrompt]: data.imageUrl
+        [imagePrompt]: data.thumbnailUrl || data.imageUrl
       };
       setGeneratedImages(newGeneratedImages);
       localStorage.setItem('generatedImages', JSON.stringify(newGeneratedImages));
@@ -266,7 +269,8 @@ export default function Create() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          text: voiceText.trim()
+          text: voiceText.trim(),
+          projectId
         })
       });
 
@@ -307,7 +311,8 @@ export default function Create() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          prompt: visualPrompt
+          prompt: visualPrompt,
+          projectId
         })
       });
 
@@ -353,7 +358,8 @@ export default function Create() {
           'Content-Type': 'application/json',
         },
         body: JSON.stringify({
-          text: voiceoverText
+          text: voiceoverText,
+          projectId
         })
       });
 
@@ -385,67 +391,102 @@ export default function Create() {
     }
   };
 
+  // Generate assets for many scenes in one request; returns per-scene results
+  const generateBatch = async (endpoint, batchScenes) => {
+    if (!batchScenes.length) return [];
+
+    const response = await fetch(`http://localhost:8000/batch/${endpoint}`, {
+      method: 'POST',
+      headers: {
+        'Content-Type': 'application/json',
+      },
+      body: JSON.stringify({
+        scenes: batchScenes,
+        projectId
+      })
+    });
+
+    const data = await response.json();
+    if (!response.ok) {
+      throw new Error(data.detail || `Failed to run ${endpoint}`);
+    }
+    return data.results;
+  };
+
+  // Merge successful batch results into the scenes and report the failures
+  const applyBatchResults = (results, fields) => {
+    const updates = {};
+    const failures = [];
+    for (const result of results) {
+      if (result.error) {
+        failures.push(`Scene ${result.sceneId}: ${result.error}`);
+      } else {
+        updates[result.sceneId] = Object.fromEntries(fields.map(field => [field, result[field]]));
+      }
+    }
+
+    setScenes(prevScenes =>
+      prevScenes.map(s => updates[String(s.id)] ? { ...s, ...updates[String(s.id)] } : s)
+    );
+    return failures;
+  };
+
   const handleGenerateAllScenes = async () => {
     setBatchGenerating(true);
     setError(null);
 
     try {
-      for (const scene of scenes) {
-        setCurrentGeneratingScene(scene.id);
-        
-        // Generate image
-        if (!scene.imageUrl) {
-          const visualPrompt = `Scene ${scene.id}\nVisual\n${scene.visual}`;
-          const imageResponse = await fetch('http://localhost:8000/generate-image', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              prompt: visualPrompt
-            })
-          });
-
-          if (!imageResponse.ok) {
-            const errorData = await imageResponse.json();
-            throw new Error(errorData.detail || 'Failed to generate image');
-          }
-
-          const imageData = await imageResponse.json();
-          scene.imageUrl = imageData.imageUrl;
-        }
-
-        // Generate voice
-        if (!scene.audioUrl) {
-          const voiceResponse = await fetch('http://localhost:8000/generate-voice', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              text: scene.voiceover
-            })
-          });
-
-          if (!voiceResponse.ok) {
-            const errorData = await voiceResponse.json();
-            throw new Error(errorData.detail || 'Failed to generate voice');
-          }
-
-          const voiceData = await voiceResponse.json();
-          scene.audioUrl = voiceData.audioUrl;
-        }
+      const [imageResults, voiceResults] = await Promise.all([
+        generateBatch(
+          'generate-images',
+          scenes.filter(scene => !scene.imageUrl).map(scene => ({ id: String(scene.id), prompt: scene.visual }))
+        ),
+        generateBatch(
+          'generate-voices',
+          scenes.filter(scene => !scene.audioUrl).map(scene => ({ id: String(scene.id), text: scene.voiceover }))
+        )
+      ]);
+
+      const failures = [
+        ...applyBatchResults(imageResults, ['imageUrl']),
+        ...applyBatchResults(voiceResults, ['audioUrl', 'audioPath'])
+      ];
+      if (failures.length) {
+        throw new Error(failures.join('\n'));
       }
 
-      // Update scenes state
-      setScenes([...scenes]);
-
     } catch (error) {
-      console.error(`Error generating content for scene ${currentGeneratingScene}:`, error);
+      console.error('Error generating scene content:', error);
       setError(error.message);
     } finally {
       setBatchGenerating(false);
-      setCurrentGeneratingScene(null);
+    }
+  };
+
+  // Browsers that play HLS natively can watch a render while it is still encoding
+  const supportsNativeHls = () =>
+    document.createElement('video').canPlayType('application/vnd.apple.mpegurl') !== '';
+
+  // Poll a render job until the backend reports a final status
+  const waitForVideoJob = async (jobId, onUpdate) => {
+    while (true) {
+      const response = await fetch(`http://localhost:8000/jobs/${jobId}`);
+      const job = await response.json();
+
+      if (!response.ok) {
+        throw new Error(job.detail || 'Failed to get video status');
+      }
+      if (onUpdate) {
+        onUpdate(job);
+      }
+      if (job.status === 'completed') {
+        return job;
+      }
+      if (job.status === 'failed' || job.status === 'cancelled') {
+        throw new Error(job.error || `Video generation ${job.status}`);
+      }
+
+      await new Promise(resolve => setTimeout(resolve, 2000));
     }
   };
 
@@ -470,7 +511,8 @@ export default function Create() {
             time: scene.time
           })),
           orientation: orientation,
-          isRecreate: false
+          isRecreate: false,
+          progressive: supportsNativeHls()
         })
       });
 
@@ -480,9 +522,15 @@ export default function Create() {
         throw new Error(data.detail || 'Failed to generate video');
       }
 
-      setVideoUrl(data.videoUrl);
-      setVideoDetails(data.details);
       setRemainingGenerations(data.remainingGenerations);
+      const job = await waitForVideoJob(data.jobId, (update) => {
+        // Start playback from the growing playlist once the first scene is published
+        if (update.status === 'running' && update.playlistUrl && update.progress?.streamedScenes > 0) {
+          setVideoUrl(update.playlistUrl);
+        }
+      });
+      setVideoUrl(job.videoUrl);
+      setVideoDetails(job.details);
 
     } catch (error) {
       console.error('Error generating video:', error);
@@ -523,8 +571,9 @@ export default function Create() {
         throw new Error(data.detail || 'Failed to generate video');
       }
 
-      setVideoUrl(data.videoUrl);
-      setVideoDetails(data.details);
+      const job = await waitForVideoJob(data.jobId);
+      setVideoUrl(job.videoUrl);
+      setVideoDetails(job.details);
 
     } catch (error) {
       console.error('Error regenerating video:', error);
@@ -559,7 +608,8 @@ export default function Create() {
       }
 
       const data = await response.json()
-      setVideoUrl(data.videoUrl)
+      const job = await waitForVideoJob(data.jobId)
+      setVideoUrl(job.videoUrl)
     } catch (error) {
       console.error('Error creating video:', error)
     }
@@ -573,49 +623,17 @@ export default function Create() {
     setError(null);
 
     try {
-      // Generate audio for each scene sequentially
-      for (let scene of scenes) {
-        if (!scene.audioUrl) {  // Only generate if audio doesn't exist
-          setCurrentGeneratingScene(scene.id);
-          
-          // Create properly formatted text with scene number
-          const voiceoverText = `Scene ${scene.id}\nVoiceover\n${scene.voiceover}`;
-          
-          const response = await fetch('http://localhost:8000/generate-voice', {
-            method: 'POST',
-            headers: {
-              'Content-Type': 'application/json',
-            },
-            body: JSON.stringify({
-              text: voiceoverText
-            })
-          });
-
-          if (!response.ok) {
-            const errorData = await response.json();
-            throw new Error(errorData.detail || 'Failed to generate voice');
-          }
-
-          const data = await response.json();
-          
-          // Update the scene with the new audio URL
-          setScenes(prevScenes => 
-            prevScenes.map(s => {
-              if (s.id === scene.id) {
-                return {
-                  ...s,
-                  audioUrl: data.audioUrl,
-                  audioPath: data.audioPath
-                };
-              }
-              return s;
-            })
-          );
-        }
+      // Only generate audio for scenes that don't have it yet
+      const results = await generateBatch(
+        'generate-voices',
+        scenes.filter(scene => !scene.audioUrl).map(scene => ({ id: String(scene.id), text: scene.voiceover }))
+      );
+
+      const failures = applyBatchResults(results, ['audioUrl', 'audioPath']);
+      if (failures.length) {
+        throw new Error(failures.join('\n'));
       }
       
-      setCurrentGeneratingScene(null);
-      
     } catch (error) {
       console.error('Error generating audio:', error);
       setError(error.message);
@@ -812,7 +830,7 @@ export default function Create() {
                     className="flex-1 bg-gradient-to-br from-purple-500 via-purple-600 to-purple-700 text-white px-6 py-4 rounded-lg hover:shadow-lg hover:shadow-purple-200/50 transition-all font-medium disabled:opacity-50 disabled:cursor-not-allowed ring-1 ring-purple-200"
                   >
                     {batchGenerating 
-                      ? `Generating Scene ${currentGeneratingScene}...` 
+                      ? 'Generating Scenes...' 
                       : 'Generate All Images'}
                   </button>
                   
@@ -822,7 +840,7 @@ export default function Create() {
                     className="flex-1 bg-gradient-to-br from-purple-500 via-purple-600 to-purple-700 text-white px-6 py-4 rounded-lg hover:shadow-lg hover:shadow-purple-200/50 transition-all font-medium disabled:opacity-50 disabled:cursor-not-allowed ring-1 ring-purple-200"
                   >
                     {batchGenerating 
-                      ? `Generating Audio ${currentGeneratingScene}...` 
+                      ? 'Generating Audio...' 
                       : 'Generate All Audio'}
                   </button>
                 </div>
@@ -1012,8 +1030,12 @@ export default function Create() {
                       controls 
                       className="w-full h-full object-cover"
                       key={videoUrl}
+                      poster={videoDetails?.previews?.posterUrl}
                     >
-                      <source src={videoUrl} type="video/mp4" />
+                      <source
+                        src={videoUrl}
+                        type={videoUrl.endsWith('.m3u8') ? 'application/vnd.apple.mpegurl' : 'video/mp4'}
+                      />
                       Your browser does not support the video tag.
                     </video>
                   </div>